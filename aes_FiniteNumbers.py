@@ -1,8 +1,10 @@
-from cuerpo_finito import G_F, FiniteNumber
+from cuerpo_finito import FiniteNumber, AFFINE_CONST, check_affine
+from catalogo_cuerpos import catalogo
 import numpy as np
 import os
 import time
 
+
 class AES: 
     """
     Documento de referencia:
@@ -12,17 +14,20 @@ class AES:
     que los empleados en el FIPS 197
     """
 
-    def __init__(self, key, polinomio_irreducible=0x11B) -> None:
+    def __init__(self, key, polinomio_irreducible=0x11B, affine_matrix=None, affine_const=AFFINE_CONST) -> None:
         """
         Entrada:
         key: bytearray de 16 24 o 32 bytes
         Polinomio_Irreducible: Entero que representa el polinomio para construir el cuerpo
+        affine_matrix, affine_const: transformación afín de la SBox (8 filas de 8 bits y un byte),
+        por defecto la del FIPS 197 (AFFINE_MATRIX, AFFINE_CONST). La matriz debe ser invertible
         SBox: equivalente a la tabla 4, p ́ag. 14
         InvSBOX: equivalente a la tabla 6, p ́ag. 23
         Rcon: equivalente a la tabla 5, p ́ag. 17
         InvMixMatrix : equivalente a la matriz usada en 5.3.3, p ́ag. 24
         """
-        self.G_F = G_F(polinomio_irreducible)
+        self.G_F = catalogo.cuerpo(polinomio_irreducible) # Shared with every instance of the same polynomial
+        self.affine_matrix, self.affine_const = check_affine(affine_matrix, affine_const)
         self.SBox, self.InvSBox = self._get_SBox()
         self.key = FiniteNumber.matrix_to_FN(np.reshape(list(key), (4, 4)).T, self.G_F)
         self.Nr = self._get_Nr(key)
@@ -54,33 +59,10 @@ class AES:
 
 
     def _get_SBox(self):
-        SBox = [0] * 256
-        InvSBox = [0] * 256
-        affine_matrix = [0b11111000, 0b01111100, 0b00111110, 0b00011111, 0b10001111, 0b11000111, 0b11100011, 0b11110001]
-        affine_const = FiniteNumber(0x63, self.G_F)
-        
-        SBox[0] = affine_const
-        InvSBox[affine_const.number] = FiniteNumber(0, self.G_F)
-        for i in range(1, 256):
-            number = FiniteNumber(i, self.G_F)
-            inverse = number.inverse().number
-            
-            bits = 0
-            for j in range(8):
-                # b = ((inverse >> j) & 1) ^ \
-                #     ((inverse >> (j + 4) % 8) & 1) ^ \
-                #     ((inverse >> (j + 5) % 8) & 1) ^ \
-                #     ((inverse >> (j + 6) % 8) & 1) ^ \
-                #     ((inverse >> (j + 7) % 8) & 1) ^ \
-                #     ((affine_const.number >> j) & 1)
-                b = FiniteNumber(affine_matrix[j] & inverse, self.G_F).xor_bits()
-                bits = (bits << 1) | b
-            result = FiniteNumber(bits, self.G_F) + affine_const
-
-            SBox[number.number] = result
-            InvSBox[result.number] = number
-        
-        return SBox, InvSBox
+        # SBox and InvSBox of the catalogue (or built by the field for another affine transformation), as FiniteNumbers
+        SBox, InvSBox = catalogo.sboxes(self.G_F.polinomio_irreducible, self.affine_matrix, self.affine_const)
+        numbers = [FiniteNumber(i, self.G_F) for i in range(256)]
+        return [numbers[n] for n in SBox], [numbers[n] for n in InvSBox]
 
 
     def SubBytes(self, State):
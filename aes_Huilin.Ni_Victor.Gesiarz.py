@@ -14,7 +14,628 @@
 """
 
 import os
-import copy
+import sys
+import mmap
+import time
+import zlib
+import struct
+import hmac
+import hashlib
+import functools
+import threading
+import importlib.machinery
+from abc import ABC, abstractmethod
+import multiprocessing
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np # Only needed by the batch engine
+except ImportError:
+    np = None
+
+try:
+    from catalogo_cuerpos import catalogo # Fields and SBoxes shared with cuerpo_finito and aes_FiniteNumbers
+except ImportError:
+    catalogo = None # This module also works on its own, building its fields with the G_F below
+
+
+# The state is a flat sequence of 16 bytes (bytearray or memoryview) in the order of the
+# input array of FIPS 197, 3.4: byte r + 4*c is the one in row r and column c.
+SHIFT_ROWS = [(i + 4 * (i % 4)) % 16 for i in range(16)] # Source index of each byte after ShiftRows
+INV_SHIFT_ROWS = [(i - 4 * (i % 4)) % 16 for i in range(16)] # Source index of each byte after InvShiftRows
+
+CHUNK_SIZE = 1 << 20 # Bytes read and written at a time by encrypt_file and decrypt_file
+BLOCK_MASK = (1 << 128) - 1 # Counter blocks of CTR mode wrap around modulo 2^128
+GCM_TAG_LENGTHS = (16, 15, 14, 13, 12, 8, 4) # Tag lengths in bytes allowed by NIST SP 800-38D, 5.2.1.2
+GCM_MAX_LENGTH = 16 * (2**32 - 2) # At most 2^32 - 2 blocks of data with the same IV (NIST SP 800-38D, 5.2.1.1)
+
+# Affine transformation of the SBox (FIPS 197, 5.1.1): row j of the matrix gives bit 7 - j of the result
+AFFINE_MATRIX = (0b11111000, 0b01111100, 0b00111110, 0b00011111, 0b10001111, 0b11000111, 0b11100011, 0b11110001)
+AFFINE_CONST = 0x63
+
+_tables_cache = {} # Tables that only depend on the field and the SBox, keyed by AES._variant (see AES._get_tables)
+_tables_lock = threading.Lock()
+
+# Optional directory where the tables of each polynomial are saved to be loaded by other processes
+TABLE_CACHE_DIR = os.environ.get('AES_TABLE_CACHE_DIR')
+TABLE_FILE_VERSION = 1
+# Magic, version, byte order of the 32-bit words, polynomial, generator and CRC-32 of the tables
+TABLE_FILE_HEADER = struct.Struct('<4sBBHHI')
+TABLE_FILE_SIZE = TABLE_FILE_HEADER.size + 512 + 256 + 256 + 256 + 8 * 256 * 4
+
+
+def block_to_state(block):
+    """
+    Converts a 4x4 block (list of rows) into a flat state.
+    """
+    return bytearray([block[i % 4][i // 4] for i in range(16)])
+
+
+def state_to_block(State, block):
+    """
+    Writes a flat state back into a 4x4 block (list of rows) and returns the block.
+    """
+    for i in range(16):
+        block[i % 4][i // 4] = State[i]
+    return block
+
+
+def _accepts_blocks(transformation):
+    """
+    Lets a transformation written for the flat state also be called with a 4x4 block,
+    which is converted to a flat state and updated in place with the result.
+    """
+    @functools.wraps(transformation)
+    def wrapper(self, State, *args):
+        if isinstance(State, list):
+            return state_to_block(transformation(self, block_to_state(State), *args), State)
+        return transformation(self, State, *args)
+    return wrapper
+
+
+def _xor_into(out, data):
+    """
+    XORs the bytes of data into the writable buffer out of the same size, in place. With NumPy
+    both buffers are used directly, otherwise they go through one integer each.
+    """
+    if np is not None:
+        target = np.frombuffer(out, dtype=np.uint8)
+        np.bitwise_xor(target, np.frombuffer(data, dtype=np.uint8), out=target)
+    else:
+        out[:] = (int.from_bytes(out, 'big') ^ int.from_bytes(data, 'big')).to_bytes(len(out), 'big')
+
+
+@functools.lru_cache(maxsize=16)
+def _transpose_masks(size):
+    """
+    Returns the masks of the three steps of _transpose_bytes for size bytes.
+    """
+    groups = size // 8
+    return tuple(int.from_bytes(bytes.fromhex(mask) * groups, 'big')
+                 for mask in ('00AA00AA00AA00AA', '0000CCCC0000CCCC', '00000000F0F0F0F0'))
+
+
+def _transpose_bytes(x, size):
+    """
+    Transposes the 8x8 bit matrix of every group of 8 bytes of the integer x of size bytes
+    (size a multiple of 8): bit c of byte r of a group becomes bit r of byte c, counting
+    bytes and bits from the most significant one. The groups are transposed all at once with
+    three swaps of bits at a fixed distance (7, 14 and 28) selected by fixed masks, so the
+    operations do not depend on the data. The transposition is its own inverse.
+    """
+    m7, m14, m28 = _transpose_masks(size)
+    t = (x ^ (x >> 7)) & m7
+    x ^= t ^ (t << 7)
+    t = (x ^ (x >> 14)) & m14
+    x ^= t ^ (t << 14)
+    t = (x ^ (x >> 28)) & m28
+    x ^= t ^ (t << 28)
+    return x
+
+
+def blocks_to_planes(data):
+    """
+    Transposes N blocks (16 * N bytes) into the 8 bit planes of the bitsliced engine.
+    Plane b is an integer of 16 * N bits that holds bit b of every byte: byte p of block i is
+    lane p * N + i and lane 0 is the most significant bit, so each position of the state
+    is a segment of N bits. The bytes of each position are gathered with extended slices,
+    every group of 8 lanes is transposed with shifts and masks (see _transpose_bytes), after
+    which byte 7 - b of each group holds bit b of its 8 lanes, and those bytes are gathered
+    into plane b with another extended slice. No table is indexed by the data.
+    """
+    lanes = b''.join([data[p::16] for p in range(16)])
+    size = len(lanes)
+    groups = _transpose_bytes(int.from_bytes(lanes, 'big'), size).to_bytes(size, 'big')
+    return [int.from_bytes(groups[7 - b::8], 'big') for b in range(8)]
+
+
+def planes_to_blocks(planes, out):
+    """
+    Inverse of blocks_to_planes: writes the blocks held in the 8 planes into out (16 * N bytes).
+    """
+    size = len(out)
+    n = size // 16
+    groups = bytearray(size)
+    for b, plane in enumerate(planes):
+        groups[7 - b::8] = plane.to_bytes(size // 8, 'big')
+    lanes = _transpose_bytes(int.from_bytes(groups, 'big'), size).to_bytes(size, 'big')
+    for p in range(16):
+        out[p::16] = lanes[p * n : (p + 1) * n]
+    return out
+
+
+@functools.lru_cache(maxsize=16)
+def _bitslice_masks(n):
+    """
+    Returns the mask of the 16 * n lanes and the masks of the segments of each row of the state
+    for planes of n blocks.
+    """
+    segment = (1 << n) - 1
+    positions = [segment << (15 - p) * n for p in range(16)]
+    rows = tuple(positions[r] | positions[r + 4] | positions[r + 8] | positions[r + 12] for r in range(4))
+    return (1 << 16 * n) - 1, rows
+
+
+def _bitslice_linear(planes, rows, full=0, constant=0):
+    """
+    Applies a linear map over GF(2) to the bits of every byte: output bit o is the XOR of
+    the input planes listed in rows[o], XORed with the lanes in full if bit o of constant is set.
+    """
+    result = []
+    for o, inputs in enumerate(rows):
+        plane = full if (constant >> o) & 1 else 0
+        for i in inputs:
+            plane ^= planes[i]
+        result.append(plane)
+    return result
+
+
+def _bitslice_xtime(planes, reduction):
+    """
+    Multiplies every byte by x: a shift of the planes plus the low bits of the polynomial.
+    """
+    high = planes[7]
+    result = [0] + planes[:7]
+    for i in reduction:
+        result[i] ^= high
+    return result
+
+
+def _bitslice_product(a, b, reduction):
+    """
+    Multiplies the bytes of two sets of planes: the 64 partial products of the bits and the
+    reduction of the 7 high bits of the product by the polynomial.
+    """
+    product = [0] * 15
+    for i in range(8):
+        ai = a[i]
+        for j in range(8):
+            product[i + j] ^= ai & b[j]
+    for k in range(14, 7, -1): # x^k = x^(k-8) * (low bits of the polynomial)
+        high = product[k]
+        for i in reduction:
+            product[k - 8 + i] ^= high
+    return product[:8]
+
+
+def _bitslice_inverse(x, reduction, square):
+    """
+    Multiplicative inverse of every byte as x^254 (0 goes to 0), with 4 products and 7 squares:
+    254 = 240 + 14, 240 = 15 * 16, 15 = 12 + 3 and 14 = 12 + 2.
+    """
+    x2 = _bitslice_linear(x, square)
+    x3 = _bitslice_product(x2, x, reduction)
+    x12 = _bitslice_linear(_bitslice_linear(x3, square), square)
+    x14 = _bitslice_product(x12, x2, reduction)
+    x240 = _bitslice_product(x12, x3, reduction)
+    for _ in range(4):
+        x240 = _bitslice_linear(x240, square)
+    return _bitslice_product(x240, x14, reduction)
+
+
+class KeyScheduleCache:
+    """
+    Bounded LRU cache of expanded keys shared by all the AES instances, keyed by the
+    polynomial and a digest of the key, so the key itself is not kept as a dictionary key.
+    The expanded keys are stored in the format of the T-table engine, as array('I') of
+    round words, and are overwritten with zeros when evicted or cleared.
+    """
+
+    def __init__(self, capacity=256) -> None:
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._salt = os.urandom(16) # Makes the digests of the keys different in every process
+
+
+    def _digest(self, variant, key):
+        return variant, hashlib.blake2b(bytes(key), digest_size=32, salt=self._salt).digest()
+
+
+    def _zeroize(self, words):
+        for i in range(len(words)):
+            words[i] = 0
+
+
+    def get(self, cache_key, expand):
+        """
+        Returns a copy of the expanded key for cache_key = (AES._variant, key) as a list of words.
+        On a miss, expand() is called to generate it and the result is stored.
+        """
+        entry_key = self._digest(*cache_key)
+        with self._lock:
+            words = self._entries.get(entry_key)
+            if words is not None:
+                self._entries.move_to_end(entry_key)
+                self.hits += 1
+                return list(words)
+            self.misses += 1
+
+        words = expand()
+        with self._lock:
+            if self.capacity > 0 and entry_key not in self._entries:
+                self._entries[entry_key] = array('I', words)
+                self._evict()
+        return words
+
+
+    def _evict(self):
+        while len(self._entries) > self.capacity:
+            _, words = self._entries.popitem(last=False) # Least recently used
+            self._zeroize(words)
+
+
+    def resize(self, capacity):
+        """
+        Changes the maximum number of expanded keys kept, evicting the oldest ones if needed.
+        """
+        with self._lock:
+            self.capacity = capacity
+            self._evict()
+
+
+    def clear(self):
+        """
+        Removes (and zeroizes) all the expanded keys and resets the counters.
+        """
+        with self._lock:
+            for words in self._entries.values():
+                self._zeroize(words)
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+key_schedule_cache = KeyScheduleCache() # Used by every AES instance
+
+
+class GHASH:
+    """
+    GHASH function of GCM (NIST SP 800-38D, 6.4) for a hash subkey H. The blocks are 128-bit
+    integers whose most significant bit is the first bit of the block, as in the standard.
+    The product by H is linear, so it is done with 16 tables of 256 entries, one per byte of
+    the block: the product of X and H is the XOR of the entries of the 16 bytes of X.
+    The data is fed with update, and pad completes the last block with zeros, which separates
+    the AAD from the ciphertext.
+    """
+
+    R = 0xE1 << 120 # Reduction by x^128 + x^7 + x^2 + x + 1, with the bits reflected
+
+    def __init__(self, tables) -> None:
+        self.tables = tables
+        self.state = 0
+        self._pending = b'' # Bytes of an incomplete block
+
+
+    @classmethod
+    def make_tables(cls, H):
+        """
+        Returns the 16 tables of the products by H: entry b of table i is the product of H and
+        the block whose byte i is b and the rest are zero. Only the products by the 128 powers
+        of x are computed, the other entries are XORs of them.
+        """
+        powers = [] # H * x^k, the block with only bit k set (bit 0 is the most significant one)
+        V = H
+        for _ in range(128):
+            powers.append(V)
+            V = (V >> 1) ^ cls.R if V & 1 else V >> 1
+
+        tables = []
+        for i in range(16):
+            table = [0] * 256
+            for j in range(8):
+                bit, product = 1 << j, powers[8 * i + 7 - j]
+                for b in range(bit):
+                    table[bit | b] = table[b] ^ product
+            tables.append(table)
+        return tables
+
+
+    def update(self, data) -> None:
+        """
+        Absorbs the bytes of data. The bytes of an incomplete last block are kept for the next call.
+        """
+        data = self._pending + bytes(data) if self._pending else memoryview(data).cast('B')
+        end = len(data) - len(data) % 16
+        T0, T1, T2, T3, T4, T5, T6, T7, T8, T9, T10, T11, T12, T13, T14, T15 = self.tables
+        Y = self.state
+        for pos in range(0, end, 16):
+            b = (Y ^ int.from_bytes(data[pos : pos + 16], 'big')).to_bytes(16, 'big')
+            Y = (T0[b[0]] ^ T1[b[1]] ^ T2[b[2]] ^ T3[b[3]] ^ T4[b[4]] ^ T5[b[5]] ^ T6[b[6]] ^ T7[b[7]]
+                 ^ T8[b[8]] ^ T9[b[9]] ^ T10[b[10]] ^ T11[b[11]] ^ T12[b[12]] ^ T13[b[13]] ^ T14[b[14]] ^ T15[b[15]])
+        self.state = Y
+        self._pending = bytes(data[end:])
+
+
+    def pad(self) -> None:
+        """
+        Completes the pending bytes with zeros up to a full block.
+        """
+        if self._pending:
+            self.update(bytes(16 - len(self._pending)))
+
+
+class CBCEncryptor:
+    """
+    Incremental CBC encryption with PKCS7 padding, created by AES.encryptor. Each call to update
+    returns the blocks that can already be encrypted and finalize adds the padding and returns
+    the last block. Only the chaining block and at most 15 bytes of data are kept between calls.
+    The output has the format of encrypt_bytes: it starts with the IV.
+    """
+
+    def __init__(self, aes, IV) -> None:
+        self._aes = aes
+        self._prev_block = int.from_bytes(IV, 'big')
+        self._header = bytes(IV) # Written before the first encrypted block
+        self._pending = bytearray() # Bytes of an incomplete block
+        self._finalized = False
+
+
+    def update(self, data) -> bytearray:
+        """
+        Encrypts the full blocks formed by the pending bytes and data and returns them.
+        """
+        if self._finalized:
+            raise ValueError("The encryptor has already been finalized")
+        data = memoryview(data).cast('B')
+        pending = len(self._pending)
+        size = (pending + len(data)) // 16 * 16
+        if size == 0:
+            self._pending += data
+            return bytearray()
+
+        header = len(self._header)
+        out = bytearray(header + size)
+        out[:header] = self._header
+        out[header : header + pending] = self._pending
+        out[header + pending :] = data[: size - pending]
+        self._prev_block = self._aes._cbc_encrypt(memoryview(out)[header:], self._prev_block)
+        self._header = b''
+        self._pending = bytearray(data[size - pending :])
+        return out
+
+
+    def finalize(self) -> bytearray:
+        """
+        Adds the PKCS7 padding to the pending bytes and returns the last encrypted block.
+        """
+        if self._finalized:
+            raise ValueError("The encryptor has already been finalized")
+        self._finalized = True
+        header = len(self._header)
+        out = bytearray(header + 16)
+        out[:header] = self._header
+        view = memoryview(out)[header:]
+        view[:len(self._pending)] = self._pending
+        self._aes._add_padding_in_place(view, len(self._pending)) # PKCS7 padding
+        self._aes._cbc_encrypt(view, self._prev_block)
+        self._pending = bytearray()
+        return out
+
+
+class CBCDecryptor:
+    """
+    Incremental CBC decryption with PKCS7 padding, created by AES.decryptor, for data in the
+    format of encrypt_bytes (the IV followed by the encrypted blocks). Each call to update
+    returns the blocks that can already be decrypted, except the last one, which is held
+    back until finalize removes its padding. Only the chaining block and at most 16 bytes
+    of data are kept between calls.
+    """
+
+    def __init__(self, aes) -> None:
+        self._aes = aes
+        self._prev_block = None # Read from the first 16 bytes
+        self._pending = b'' # Bytes of an incomplete block, or the last block
+        self._finalized = False
+
+
+    def update(self, data) -> bytearray:
+        """
+        Decrypts the full blocks formed by the pending bytes and data and returns them,
+        keeping back the last block (or the bytes of an incomplete one).
+        """
+        if self._finalized:
+            raise ValueError("The decryptor has already been finalized")
+        data = self._pending + bytes(data)
+        if self._prev_block is None:
+            if len(data) < 16:
+                self._pending = data
+                return bytearray()
+            self._prev_block = int.from_bytes(data[:16], 'big') # The first block is the IV
+            data = data[16:]
+
+        keep = len(data) % 16 or min(16, len(data))
+        out = bytearray(len(data) - keep)
+        self._prev_block = self._aes._cbc_decrypt(memoryview(data)[: len(data) - keep], self._prev_block, memoryview(out))
+        self._pending = data[len(data) - keep :]
+        return out
+
+
+    def finalize(self) -> bytearray:
+        """
+        Decrypts the last block and returns it without the PKCS7 padding.
+        """
+        if self._finalized:
+            raise ValueError("The decryptor has already been finalized")
+        self._finalized = True
+        if self._prev_block is None or len(self._pending) != 16:
+            raise ValueError("Invalid length of encrypted data")
+        out = bytearray(16)
+        self._aes._cbc_decrypt(memoryview(self._pending), self._prev_block, memoryview(out))
+        del out[16 - self._aes._padding_length(out):]
+        self._pending = b''
+        return out
+
+
+class CBCFileReader:
+    """
+    Read-only, seekable view of the decrypted contents of a file written by encrypt_file,
+    created by AES.open_encrypted. In CBC the plaintext block i only depends on the ciphertext
+    blocks i - 1 and i (the IV being block -1), so a read decrypts just the blocks that cover
+    the range, in a single batch. The padding is only read once, when the file is opened, to
+    know the size of the plaintext. The last decrypted blocks are kept in a small LRU cache,
+    so consecutive or repeated reads of nearby ranges do not decrypt them again.
+    """
+
+    def __init__(self, aes, file, cache_blocks=256) -> None:
+        self._aes = aes
+        self._file = open(file, 'rb')
+        self._lock = threading.Lock()
+        self._cache = OrderedDict() # Decrypted blocks by index
+        self.cache_blocks = cache_blocks
+        self.hits = 0
+        self.misses = 0
+        self._pos = 0
+        try:
+            encrypted_size = os.fstat(self._file.fileno()).st_size - 16 # Without the IV
+            if encrypted_size < 16 or encrypted_size % 16:
+                raise ValueError("Invalid length of encrypted data")
+            self.size = encrypted_size # Provisional, so that the last block can be read
+            last_block = self._get_blocks(encrypted_size // 16 - 1, encrypted_size // 16 - 1)
+            self.size = encrypted_size - self._aes._padding_length(last_block)
+        except Exception:
+            self._file.close()
+            raise
+
+
+    def _get_blocks(self, first, last):
+        """
+        Returns the decrypted blocks first to last (both included) as a bytearray, from the
+        cache if all of them are there, otherwise decrypting them together with the ciphertext
+        block before the first one as the chaining value.
+        """
+        with self._lock:
+            cache = self._cache
+            count = last - first + 1
+            if count <= self.cache_blocks and all(i in cache for i in range(first, last + 1)):
+                self.hits += 1
+                for i in range(first, last + 1):
+                    cache.move_to_end(i)
+                return bytearray(b''.join([cache[i] for i in range(first, last + 1)]))
+
+            self.misses += 1
+            self._file.seek(16 * first) # Block first - 1 of the ciphertext, the IV for the first block
+            encrypted = bytearray(16 * (count + 1))
+            if self._aes._read_chunk(self._file, memoryview(encrypted)) != len(encrypted):
+                raise ValueError("The encrypted file is shorter than expected")
+            data = bytearray(16 * count)
+            self._aes._cbc_decrypt(memoryview(encrypted)[16:], int.from_bytes(encrypted[:16], 'big'), memoryview(data))
+
+            # Only the last blocks of a long range are kept, the next read usually starts there
+            for i in range(max(first, last + 1 - self.cache_blocks), last + 1):
+                cache[i] = bytes(data[16 * (i - first) : 16 * (i - first + 1)])
+                cache.move_to_end(i)
+            while len(cache) > self.cache_blocks:
+                cache.popitem(last=False)
+            return data
+
+
+    def pread(self, size, offset):
+        """
+        Returns up to size bytes of the decrypted data starting at offset, without changing the
+        current position. Fewer bytes are returned at the end of the data.
+        """
+        if offset < 0:
+            raise ValueError("Negative offset")
+        end = self.size if size < 0 else min(offset + size, self.size)
+        if offset >= end:
+            return b''
+        first = offset // 16
+        data = self._get_blocks(first, (end - 1) // 16)
+        return bytes(data[offset - 16 * first : end - 16 * first])
+
+
+    def read(self, size=-1):
+        """
+        Returns up to size bytes (all the remaining ones if size is negative) from the current
+        position and advances it.
+        """
+        data = self.pread(size, self._pos)
+        self._pos += len(data)
+        return data
+
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        """
+        Changes the current position, relative to the start (SEEK_SET), the current position
+        (SEEK_CUR) or the end of the decrypted data (SEEK_END). Returns the new position.
+        """
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        elif whence != os.SEEK_SET:
+            raise ValueError(f"Invalid whence {whence}")
+        if offset < 0:
+            raise ValueError("Negative seek position")
+        self._pos = offset
+        return offset
+
+
+    def tell(self):
+        return self._pos
+
+
+    def close(self):
+        self._file.close()
+        self._cache.clear()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def check_affine(affine_matrix=None, affine_const=AFFINE_CONST):
+    """
+    Returns the affine transformation of the SBox as (tuple of 8 rows, constant), AFFINE_MATRIX
+    if the matrix is None. Raises ValueError if a row or the constant is not a byte or the matrix
+    is not invertible over GF(2), since then the SBox would not be a permutation.
+    """
+    affine_matrix = AFFINE_MATRIX if affine_matrix is None else tuple(affine_matrix)
+    if len(affine_matrix) != 8 or not all(0 <= n <= 0xFF for n in affine_matrix + (affine_const,)):
+        raise ValueError("The affine matrix must have 8 rows of 8 bits and the constant must be a byte")
+    rows = list(affine_matrix)
+    for rank in range(8): # Gaussian elimination, one pivot per bit
+        bit = 1 << (7 - rank)
+        pivot = next((i for i in range(rank, 8) if rows[i] & bit), None)
+        if pivot is None:
+            raise ValueError("The affine matrix is not invertible, the SBox is not a permutation")
+        rows[rank], rows[pivot] = rows[pivot], rows[rank]
+        for i in range(rank + 1, 8):
+            if rows[i] & bit:
+                rows[i] ^= rows[rank]
+    return affine_matrix, affine_const
 
 
 class G_F:
@@ -23,31 +644,81 @@ class G_F:
     By default, it uses the AES polynomial. The elements of the field are represented by integers 0 <= n <= 255.
     """
     
-    def __init__(self, polinomio_irreducible=0x11B) -> None:
+    def __init__(self, polinomio_irreducible=0x11B, tabla_completa=False) -> None:
         """
         Initializes the field with the given irreducible polynomial.
         Also creates the EXP and LOG tables for efficient multiplication and inversion.
+        With tabla_completa, producto, inverso and division use the full 64 KiB multiplication
+        table instead, built the first time one of them is called.
         """
+        if not self.es_irreducible(polinomio_irreducible):
+            raise ValueError(f"{hex(polinomio_irreducible)} is not an irreducible polynomial of degree 8")
         self.polinomio_irreducible = polinomio_irreducible
         self.table_exp = [0] * 512 # Exponentiation table
         self.table_log = [0] * 256 # Logarithm table
         self.generator = self._encontrar_generador() # Find a valid generator
         self._crear_tablas() # Create tables for fast operations
+        self._iniciar_tablas_producto(tabla_completa)
     
     
+    @classmethod
+    def from_tables(cls, polinomio_irreducible, generator, table_exp, table_log, filas=None):
+        """
+        Creates the field from previously generated EXP and LOG tables,
+        without searching for a generator again. The tables are used as given, without copies.
+        filas can give rows of products by a constant already computed (see fila), by constant.
+        """
+        field = cls.__new__(cls)
+        field.polinomio_irreducible = polinomio_irreducible
+        field.generator = generator
+        field.table_exp = table_exp
+        field.table_log = table_log
+        field._iniciar_tablas_producto(False)
+        field._filas.update(filas or {})
+        return field
+
+
+    @staticmethod
+    def es_irreducible(polinomio) -> bool:
+        """
+        Checks that the polynomial has degree 8 and no factor of degree 1 to 4, which is
+        enough for it to be irreducible (a reducible polynomial of degree 8 has a factor of
+        degree at most 4). Each factor is tested by computing the remainder of the division.
+        """
+        if polinomio >> 8 != 1:
+            return False
+        for divisor in range(2, 32): # Every polynomial of degree 1 to 4
+            degree = divisor.bit_length()
+            remainder = polinomio
+            while remainder.bit_length() >= degree:
+                remainder ^= divisor << (remainder.bit_length() - degree)
+            if remainder == 0:
+                return False
+        return True
+
+
+    def potencia(self, a, n) -> int:
+        """
+        Returns a^n using square and multiply, so it needs about 2 * log2(n) products.
+        It only uses producto_lento, so it can be called before the tables exist.
+        """
+        result = 1
+        while n > 0:
+            if n & 1:
+                result = self.producto_lento(result, a)
+            a = self.producto_lento(a, a)
+            n >>= 1
+        return result
+
+
     def _encontrar_generador(self) -> int:
         """
-        Tries different numbers to find a valid generator that covers all elements in the field.
+        Returns the smallest generator of the multiplicative group, which has order 255 = 3 * 5 * 17.
+        The order of a candidate g divides 255, so g is a generator unless g^(255/p) == 1 for one
+        of the prime factors p.
         """
         for candidate in range(2, 256):
-            seen_elements = set() # By definition, in a set there are no repetitions
-            element = 1
-            
-            for _ in range(255):
-                seen_elements.add(element)
-                element = self.producto_lento(element, candidate) # Multiply using slow method
-            
-            if len(seen_elements) == 255: # If the candidate has different results for each power, then it's a valid generator
+            if all(self.potencia(candidate, 255 // p) != 1 for p in (3, 5, 17)):
                 return candidate
         raise ValueError("No valid generator found")
 
@@ -55,16 +726,22 @@ class G_F:
     def _crear_tablas(self) -> None:
         """
         Creates the EXP and LOG tables using the found generator.
+        The product by the generator is linear, so each power is the previous one multiplied
+        with two lookups in the products of the generator by the low and the high nibbles.
         """
+        generator = self.generator
+        low = [self.producto_lento(generator, n) for n in range(16)]
+        high = [self.producto_lento(generator, n << 4) for n in range(16)]
+        table_exp, table_log = self.table_exp, self.table_log
         x = 1 
         for i in range(255):
-            self.table_exp[i] = x 
-            self.table_log[x] = i 
-            x = self.producto_lento(x, self.generator) # Generate next power of the generator
+            table_exp[i] = x 
+            table_log[x] = i 
+            x = low[x & 15] ^ high[x >> 4] # Generate next power of the generator
     
         # We fill a duplicated table so that it won't be necessary to substract exponents when calculating the 'producto rápido'
         for i in range(255, 512):
-            self.table_exp[i] = self.table_exp[i - 255] 
+            table_exp[i] = table_exp[i - 255]
 		
 
     def suma(self, a, b) -> int:
@@ -124,8 +801,112 @@ class G_F:
         """
         if a == 0 or b == 0:
             return 0
-        log_sum = self.table_log[a] - self.table_log[b]
-        return self.table_exp[log_sum]
+        log_diff = self.table_log[a] - self.table_log[b] + 255 # Always in 1..509, no negative indexes
+        return self.table_exp[log_diff]
+
+
+    def _iniciar_tablas_producto(self, tabla_completa) -> None:
+        """
+        Prepares the full multiplication table, the inverse table and the rows of products by a
+        constant, all of them created the first time they are needed. With tabla_completa the
+        instance uses the full table for producto, inverso and division.
+        """
+        self._tabla_producto = None
+        self._tabla_inverso = None
+        self._filas = {}
+        self.tabla_completa = tabla_completa
+        if tabla_completa:
+            self.producto = self._producto_tabla
+            self.inverso = self._inverso_tabla
+            self.division = self._division_tabla
+
+
+    def fila(self, n) -> bytes:
+        """
+        Returns the row of products by the constant n as 256 bytes: fila(n)[x] is the product of
+        n and x. MixColumns and InvMixColumns index the rows of 02, 03, 09, 0b, 0d and 0e directly.
+        """
+        row = self._filas.get(n)
+        if row is None:
+            if self._tabla_producto is not None:
+                row = self._tabla_producto[n << 8 : (n + 1) << 8]
+            elif n == 0:
+                row = bytes(256)
+            else:
+                table_exp, table_log = self.table_exp, self.table_log
+                log_n = table_log[n]
+                row = bytes([0] + [table_exp[log_n + table_log[x]] for x in range(1, 256)])
+            self._filas[n] = row
+        return row
+
+
+    @property
+    def tabla_producto(self) -> bytes:
+        """
+        Full multiplication table as a flat 64 KiB bytes object: the product of a and b is
+        tabla_producto[(a << 8) | b]. It is built the first time it is used.
+        """
+        if self._tabla_producto is None:
+            self._tabla_producto = b''.join(self.fila(n) for n in range(256))
+        return self._tabla_producto
+
+
+    @property
+    def tabla_inverso(self) -> bytes:
+        """
+        Table of the 256 multiplicative inverses, with 0 as the inverse of 0.
+        """
+        if self._tabla_inverso is None:
+            table_exp, table_log = self.table_exp, self.table_log
+            self._tabla_inverso = bytes([0] + [table_exp[255 - table_log[n]] for n in range(1, 256)])
+        return self._tabla_inverso
+
+
+    def sbox(self, affine_matrix=AFFINE_MATRIX, affine_const=AFFINE_CONST) -> tuple:
+        """
+        Returns the SBox and InvSBox of AES over this field as two bytes objects: the inverse of
+        each byte followed by the affine transformation (FIPS 197, 5.1.1).
+        The transformation is linear over GF(2), so the image of a byte is the XOR of the images
+        of its bits: they are combined once in two tables of 16 entries (low and high nibble)
+        and each entry of the SBox is two lookups applied to the table of inverses.
+        The transformation is checked with check_affine.
+        """
+        affine_matrix, affine_const = check_affine(affine_matrix, affine_const)
+        # Image of bit k: bit 7 - j of the image is bit k of row j
+        columns = [sum(((row >> k) & 1) << (7 - j) for j, row in enumerate(affine_matrix)) for k in range(8)]
+        low, high = [0] * 16, [0] * 16
+        for n in range(16):
+            for k in range(4):
+                if (n >> k) & 1:
+                    low[n] ^= columns[k]
+                    high[n] ^= columns[k + 4]
+
+        SBox = bytes([low[inverse & 15] ^ high[inverse >> 4] ^ affine_const for inverse in self.tabla_inverso])
+        InvSBox = bytearray(256)
+        for i, result in enumerate(SBox):
+            InvSBox[result] = i
+        return SBox, bytes(InvSBox)
+
+
+    def _producto_tabla(self, a, b) -> int:
+        """
+        Returns the product of two elements with a single lookup in the full table.
+        """
+        return self.tabla_producto[(a << 8) | b]
+
+
+    def _inverso_tabla(self, n) -> int:
+        """
+        Returns the multiplicative inverse of n with a lookup in the inverse table.
+        """
+        return self.tabla_inverso[n]
+
+
+    def _division_tabla(self, a, b) -> int:
+        """
+        Returns the division between a and b as the product of a and the inverse of b.
+        """
+        return self.tabla_producto[(a << 8) | self.tabla_inverso[b]]
 
 
 class AES: 
@@ -137,21 +918,44 @@ class AES:
     as those used in FIPS 197
 """
 
-    def __init__(self, key, polinomio_irreducible=0x11B) -> None:
+    def __init__(self, key, polinomio_irreducible=0x11B, engine=None, affine_matrix=None, affine_const=AFFINE_CONST,
+                 *, key_cache=None, disk_cache=True) -> None:
         """
         Input:
         key: bytearray of 16, 24, or 32 bytes
         Polinomio_Irreducible: Integer representing the polynomial used to construct the field
+        engine: name of the engine used to run the cipher (see ENGINES), by default the AES_ENGINE
+        environment variable or, if it is not set, the fastest correct engine for each payload size
+        affine_matrix, affine_const: affine transformation of the SBox, 8 rows of 8 bits and a byte,
+        by default the ones of FIPS 197 (AFFINE_MATRIX, AFFINE_CONST). The matrix must be invertible
+        key_cache: KeyScheduleCache of the round keys, by default the shared key_schedule_cache
+        disk_cache: whether the tables can be loaded from and saved to TABLE_CACHE_DIR
         SBox: equivalent to table 4, p. 14
         InvSBox: equivalent to table 6, p. 23
         Rcon: equivalent to table 5, p. 17
         InvMixMatrix: equivalent to the matrix used in 5.3.3, p. 24
+        Te, Td: round tables that merge SubBytes/MixColumns and InvSubBytes/InvMixColumns
         """
-        self.G_F = G_F(polinomio_irreducible) # Initialize Galois Field
-        self.SBox, self.InvSBox = self._get_SBox() # Calculate SBox and InvSBox
-        self.key = key 
+        self.affine_matrix, self.affine_const = check_affine(affine_matrix, affine_const)
+        self._variant = (polinomio_irreducible, self.affine_matrix, self.affine_const) # Everything the tables depend on
+        self._table_cache_dir = TABLE_CACHE_DIR if disk_cache else None
+        self._tables = self._get_tables(self._variant) # Tables shared by every instance with this variant
+        self.G_F = self._tables['G_F']
+        self.SBox, self.InvSBox = self._tables['SBox'], self._tables['InvSBox']
+        self.Te, self.Td = self._tables['Te'], self._tables['Td']
+        self.key = key = bytes(key) # Own copy, later changes to the caller's buffer must not reach the cipher or its workers
         self.Nr = self._get_Nr(key) # Determine the number of rounds
-        self.expanded_key = self.KeyExpansion(self.key) # Expand the key for all rounds
+        # Round keys as 32-bit words (see _get_round_words), taken from the key schedule cache if possible
+        key_cache = key_schedule_cache if key_cache is None else key_cache
+        words = key_cache.get((self._variant, key), lambda: self._get_round_words(key))
+        self.round_words, self.inv_round_words = words[:len(words) // 2], words[len(words) // 2:]
+        self._expanded_key = None # Round keys as 4x4 blocks, generated on first use
+        self._expanded_key_dec = None # Round keys of the equivalent inverse cipher as 4x4 blocks, generated on first use
+        self._batch_round_keys = None # Round keys of the NumPy batch engine, generated on first use
+        self._bitslice_round_keys = None # Round keys of the bitsliced engine as (blocks, planes), generated on first use
+        self._ghash_tables = None # Tables of GHASH for the hash subkey of this key, generated on first use
+        engine = engine or os.environ.get('AES_ENGINE')
+        self.engine = get_engine(engine) if engine else None # None means automatic selection
 
     @classmethod
     def print_array(cls, array, row_len=0, format="hex"):
@@ -184,6 +988,111 @@ class AES:
             print()
 
 
+    def _get_tables(self, variant):
+        """
+        Returns the tables that only depend on the field and the SBox (G_F, SBox, InvSBox, Te, Td)
+        from the process-wide cache, for variant = (polynomial, affine matrix, affine constant).
+        The first time the variant is used they are loaded from the on-disk cache if
+        TABLE_CACHE_DIR is set (and disk_cache was not disabled). Otherwise the field (see
+        _get_field) and the SBoxes of FIPS 197 come from the catalogue of fields if it can be
+        imported, or are generated here, and the T-tables are generated from them.
+        The cached tables are shared between instances and threads, so they are never modified.
+        """
+        polinomio_irreducible = variant[0]
+        with _tables_lock:
+            tables = _tables_cache.get(variant)
+            if tables is None and self._table_cache_dir:
+                tables = self._load_tables_file(polinomio_irreducible)
+            if tables is None:
+                field = self._get_field(polinomio_irreducible) # Initialize Galois Field
+                if catalogo is not None and polinomio_irreducible in catalogo and (self.affine_matrix, self.affine_const) == (AFFINE_MATRIX, AFFINE_CONST):
+                    SBox, InvSBox = catalogo.sbox(polinomio_irreducible), catalogo.inv_sbox(polinomio_irreducible)
+                else:
+                    SBox, InvSBox = self._get_SBox(field) # Calculate SBox and InvSBox
+                Te, Td = self._get_TTables(field, SBox, InvSBox) # Calculate the round tables of the T-table engine
+                tables = {'G_F': field, 'SBox': SBox, 'InvSBox': InvSBox,
+                          'Te': tuple(map(tuple, Te)), 'Td': tuple(map(tuple, Td))}
+                if self._table_cache_dir:
+                    self._save_tables_file(tables)
+            _tables_cache[variant] = tables
+        return tables
+
+
+    def _get_field(self, polinomio_irreducible):
+        """
+        Returns a new G_F of the polynomial. If the catalogue of fields can be imported it is
+        created from the record of the polynomial (EXP, LOG and the rows of the MixColumns
+        constants) without computing anything, otherwise the tables are generated.
+        """
+        if catalogo is not None and polinomio_irreducible in catalogo:
+            return G_F.from_tables(polinomio_irreducible, catalogo.generador(polinomio_irreducible), catalogo.exp(polinomio_irreducible),
+                                   catalogo.log(polinomio_irreducible), catalogo.filas(polinomio_irreducible))
+        return G_F(polinomio_irreducible)
+
+
+    def _tables_file_name(self, polinomio_irreducible):
+        """
+        Returns the path of the file of the on-disk table cache for the given polynomial.
+        The tables of a custom affine transformation go to a file named after it too.
+        """
+        name = f'aes_tables_0x{polinomio_irreducible:03X}'
+        if (self.affine_matrix, self.affine_const) != (AFFINE_MATRIX, AFFINE_CONST):
+            name += f'_{bytes(self.affine_matrix).hex()}{self.affine_const:02x}'
+        return os.path.join(self._table_cache_dir, name + '.bin')
+
+
+    def _load_tables_file(self, polinomio_irreducible):
+        """
+        Loads the tables of the polynomial from the on-disk cache with a single mmap.
+        The tables are memoryviews of the map, which stays open while they are referenced,
+        so nothing is copied. Returns None if the file does not exist or is stale or corrupt,
+        so that the tables are generated and the file is written again.
+        """
+        try:
+            with open(self._tables_file_name(polinomio_irreducible), 'rb') as file:
+                mapped = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, ValueError):
+            return None
+        if len(mapped) != TABLE_FILE_SIZE:
+            return None
+        magic, version, byteorder, polinomio, generator, checksum = TABLE_FILE_HEADER.unpack_from(mapped)
+        if (magic, version, byteorder, polinomio) != (b'AEST', TABLE_FILE_VERSION, sys.byteorder == 'big', polinomio_irreducible):
+            return None
+        data = mapped[TABLE_FILE_HEADER.size:]
+        if zlib.crc32(data) != checksum:
+            return None
+
+        words = data[1280:].cast('I') # Te0..Te3 and Td0..Td3
+        T = tuple(words[256*i : 256*i + 256] for i in range(8))
+        field = G_F.from_tables(polinomio_irreducible, generator, data[:512], data[512:768])
+        return {'G_F': field, 'SBox': data[768:1024], 'InvSBox': data[1024:1280], 'Te': T[:4], 'Td': T[4:]}
+
+
+    def _save_tables_file(self, tables):
+        """
+        Writes the tables to the on-disk cache. The file is written under a temporary name
+        and then renamed, so other processes never see it half written. Errors are ignored,
+        since the cache is only an optimization.
+        """
+        field = tables['G_F']
+        data = bytes(field.table_exp) + bytes(field.table_log) + bytes(tables['SBox']) + bytes(tables['InvSBox'])
+        data += b''.join(array('I', table).tobytes() for table in tables['Te'] + tables['Td'])
+        header = TABLE_FILE_HEADER.pack(b'AEST', TABLE_FILE_VERSION, sys.byteorder == 'big',
+                                        field.polinomio_irreducible, field.generator, zlib.crc32(data))
+        file_name = self._tables_file_name(field.polinomio_irreducible)
+        temp_name = f'{file_name}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(self._table_cache_dir, exist_ok=True)
+            with open(temp_name, 'wb') as file:
+                file.write(header + data)
+            os.replace(temp_name, file_name)
+        except OSError:
+            try:
+                os.remove(temp_name)
+            except OSError:
+                pass
+
+
     def _get_Nr(self, key):
         """
         Determines the number of rounds based on the key length. 
@@ -199,137 +1108,144 @@ class AES:
             raise ValueError("Invalid key length")
 
 
-    def _get_SBox(self):
+    def _get_SBox(self, field=None):
         """
-        Generates the SBox and InvSBox used for byte substitution. 
-        Implements the affine transformation to create these tables.
+        Generates the SBox and InvSBox used for byte substitution over field (by default the one
+        of this instance) with the affine transformation of this instance (see G_F.sbox).
         """
-        SBox = [0] * 256
-        InvSBox = [0] * 256
-        affine_matrix = [0b11111000, 0b01111100, 0b00111110, 0b00011111, 0b10001111, 0b11000111, 0b11100011, 0b11110001]
-        affine_const = 0x63
-        
-        SBox[0] = affine_const
-        InvSBox[affine_const] = 0
-        for i in range(1, 256):
-            inverse = self.G_F.inverso(i)
-        
-            bits = 0
-            for j in range(8):
-                b = affine_matrix[j] & inverse # Apply the affine transformation
-                bit = 0
-                while b > 0:
-                    bit ^= (b & 1) # XOR all bits
-                    b >>= 1
-                bits = (bits << 1) | bit # Construct the transformed value
-            result = bits ^ affine_const # Apply the affine constant
-
-            SBox[i] = result
-            InvSBox[result] = i
-        
-        return SBox, InvSBox
+        return (field or self.G_F).sbox(self.affine_matrix, self.affine_const)
 
 
+    def _get_TTables(self, field, SBox, InvSBox):
+        """
+        Generates the four encryption tables Te0..Te3 and the four decryption tables Td0..Td3.
+        Each entry is a 32-bit column word: Te0[x] holds the column (02, 01, 01, 03) * SBox[x]
+        and Td0[x] the column (0e, 09, 0d, 0b) * InvSBox[x]. The tables for rows 1, 2 and 3
+        are the same words rotated one byte to the right, so one round of SubBytes, ShiftRows
+        and MixColumns (or their inverses) becomes 16 lookups and XORs on four column words.
+        The products come from the rows of field and the substitutions from SBox and InvSBox.
+        """
+        fila = field.fila
+        m2, m3, me, m9, md, mb = fila(0x02), fila(0x03), fila(0x0e), fila(0x09), fila(0x0d), fila(0x0b)
+        Te0, Te1, Te2, Te3 = [0] * 256, [0] * 256, [0] * 256, [0] * 256
+        Td0, Td1, Td2, Td3 = [0] * 256, [0] * 256, [0] * 256, [0] * 256
+
+        for x in range(256):
+            s = SBox[x]
+            word = (m2[s] << 24) | (s << 16) | (s << 8) | m3[s]
+            Te0[x] = word
+            Te1[x] = ((word >> 8) | (word << 24)) & 0xFFFFFFFF # Rotate one byte to the right
+            Te2[x] = ((word >> 16) | (word << 16)) & 0xFFFFFFFF
+            Te3[x] = ((word >> 24) | (word << 8)) & 0xFFFFFFFF
+
+            s = InvSBox[x]
+            word = (me[s] << 24) | (m9[s] << 16) | (md[s] << 8) | mb[s]
+            Td0[x] = word
+            Td1[x] = ((word >> 8) | (word << 24)) & 0xFFFFFFFF
+            Td2[x] = ((word >> 16) | (word << 16)) & 0xFFFFFFFF
+            Td3[x] = ((word >> 24) | (word << 8)) & 0xFFFFFFFF
+
+        return (Te0, Te1, Te2, Te3), (Td0, Td1, Td2, Td3)
+
+
+    @_accepts_blocks
     def SubBytes(self, State):
         """
         Applies the SubBytes transformation to the state.
         Each byte is replaced with its corresponding value in SBox.
         """
-        for i in range(4):
-            for j in range(4): 
-                number = State[i][j]
-                State[i][j] = self.SBox[number] # Substitute using SBox
+        SBox = self.SBox
+        for i in range(16):
+            State[i] = SBox[State[i]] # Substitute using SBox
         return State
 
 
+    @_accepts_blocks
     def InvSubBytes(self, State):
         """
         Applies the InvSubBytes transformation to the state.
         Each byte is replaced with its corresponding value in InvSBox.
         """
-        for i in range(4):
-            for j in range(4):
-                number = State[i][j]
-                State[i][j] = self.InvSBox[number] # Substitute using InvSBox
+        InvSBox = self.InvSBox
+        for i in range(16):
+            State[i] = InvSBox[State[i]] # Substitute using InvSBox
         return State
 
 
+    @_accepts_blocks
     def ShiftRows(self, State):
         """
         Performs the ShiftRows transformation on the state.
         Each row is shifted left by its row index.
         """
-        for i in range(4):
-            State[i] = State[i][i:] + State[i][:i] # Shift row i
+        State[:] = bytes([State[i] for i in SHIFT_ROWS])
         return State
 
 
+    @_accepts_blocks
     def InvShiftRows(self, State):
         """
         Performs the InvShiftRows transformation on the state.
         Each row is shifted right by its row index.
         """
-        for i in range(4):
-            State[i] = State[i][-i:] + State[i][:-i] # Shift row i to the right
+        State[:] = bytes([State[i] for i in INV_SHIFT_ROWS])
         return State
 
 
+    @_accepts_blocks
     def MixColumns(self, State):
         """
         Performs the MixColumns transformation on the state.
         Combines the bytes in each column using polynomial multiplication.
         """
-        n1 = 0x01
-        n2 = 0x02
-        n3 = 0x03
+        m2 = self.G_F.fila(0x02) # Rows of the products by 02 and 03
+        m3 = self.G_F.fila(0x03)
 
-        for col in range(4):
-            s0 = State[0][col]
-            s1 = State[1][col]
-            s2 = State[2][col]
-            s3 = State[3][col]
+        for col in range(0, 16, 4):
+            s0, s1, s2, s3 = State[col : col + 4]
 
             # Calculate new values for each row in the column
-            State[0][col] = self.G_F.producto(n2, s0) ^ self.G_F.producto(n3, s1) ^ s2 ^ s3
-            State[1][col] = s0 ^ self.G_F.producto(n2, s1) ^ self.G_F.producto(n3, s2) ^ s3
-            State[2][col] = s0 ^ s1 ^ self.G_F.producto(n2, s2) ^ self.G_F.producto(n3, s3)
-            State[3][col] = self.G_F.producto(n3, s0) ^ s1 ^ s2 ^ self.G_F.producto(n2, s3)
+            State[col] = m2[s0] ^ m3[s1] ^ s2 ^ s3
+            State[col + 1] = s0 ^ m2[s1] ^ m3[s2] ^ s3
+            State[col + 2] = s0 ^ s1 ^ m2[s2] ^ m3[s3]
+            State[col + 3] = m3[s0] ^ s1 ^ s2 ^ m2[s3]
         
         return State
 
 
+    @_accepts_blocks
     def InvMixColumns(self, State):
         """
         Performs the InvMixColumns transformation on the state.
         Reverses the MixColumns transformation using polynomial multiplication.
         """
-        ne = 0x0e
-        nb = 0x0b
-        nd = 0x0d
-        n9 = 0x09
+        me = self.G_F.fila(0x0e) # Rows of the products by 0e, 0b, 0d and 09
+        mb = self.G_F.fila(0x0b)
+        md = self.G_F.fila(0x0d)
+        m9 = self.G_F.fila(0x09)
 
-        for col in range(4):
-            s0 = State[0][col]
-            s1 = State[1][col]
-            s2 = State[2][col]
-            s3 = State[3][col]
+        for col in range(0, 16, 4):
+            s0, s1, s2, s3 = State[col : col + 4]
 
             # Calculate new values for each row in the column
-            State[0][col] = self.G_F.producto(ne, s0) ^ self.G_F.producto(nb, s1) ^ self.G_F.producto(nd, s2) ^ self.G_F.producto(n9, s3)
-            State[1][col] = self.G_F.producto(n9, s0) ^ self.G_F.producto(ne, s1) ^ self.G_F.producto(nb, s2) ^ self.G_F.producto(nd, s3)
-            State[2][col] = self.G_F.producto(nd, s0) ^ self.G_F.producto(n9, s1) ^ self.G_F.producto(ne, s2) ^ self.G_F.producto(nb, s3)
-            State[3][col] = self.G_F.producto(nb, s0) ^ self.G_F.producto(nd, s1) ^ self.G_F.producto(n9, s2) ^ self.G_F.producto(ne, s3)
+            State[col] = me[s0] ^ mb[s1] ^ md[s2] ^ m9[s3]
+            State[col + 1] = m9[s0] ^ me[s1] ^ mb[s2] ^ md[s3]
+            State[col + 2] = md[s0] ^ m9[s1] ^ me[s2] ^ mb[s3]
+            State[col + 3] = mb[s0] ^ md[s1] ^ m9[s2] ^ me[s3]
         
         return State
 
 
+    @_accepts_blocks
     def AddRoundKey(self, State, roundKey):
         """
         Performs the AddRoundKey transformation by XORing the state with the round key.
+        The round key can be given either flat or as a 4x4 block.
         """
-        for i in range(4):
-            for j in range(4):
-                State[i][j] ^= roundKey[i][j]
+        if isinstance(roundKey, list):
+            roundKey = block_to_state(roundKey)
+        for i in range(16):
+            State[i] ^= roundKey[i]
         return State
     
 
@@ -388,9 +1304,347 @@ class AES:
         return expanded_key_blocks
 
 
+    def KeyExpansionEIC(self, key):
+        """
+        Expands the key into the round keys of the equivalent inverse cipher (FIPS 197, 5.3.5):
+        the same round keys as KeyExpansion with InvMixColumns applied to all but the first and last.
+        """
+        expanded_key_blocks = self.KeyExpansion(key)
+        for i in range(1, self.Nr):
+            self.InvMixColumns(expanded_key_blocks[i])
+        return expanded_key_blocks
+
+
+    def _words_to_blocks(self, words):
+        """
+        Converts round keys given as 32-bit column words into a list of 4x4 blocks.
+        """
+        return [[[(words[i + col] >> (24 - 8 * row)) & 0xFF for col in range(4)] for row in range(4)]
+                for i in range(0, len(words), 4)]
+
+
+    @property
+    def expanded_key(self):
+        """
+        Round keys as a list of 4x4 blocks, the same as returned by KeyExpansion.
+        """
+        if self._expanded_key is None:
+            self._expanded_key = self._words_to_blocks(self.round_words)
+        return self._expanded_key
+
+
+    @property
+    def expanded_key_dec(self):
+        """
+        Round keys of the equivalent inverse cipher as a list of 4x4 blocks, the same as returned
+        by KeyExpansionEIC. They are taken from the decryption words computed with the key
+        schedule, which are in reverse order.
+        """
+        if self._expanded_key_dec is None:
+            self._expanded_key_dec = self._words_to_blocks(self.inv_round_words)[::-1]
+        return self._expanded_key_dec
+
+
+    def _get_round_words(self, key):
+        """
+        Expands the key directly into the 32-bit column words used by the T-table engine.
+        Returns the encryption words followed by the decryption words, which follow the
+        equivalent inverse cipher (FIPS 197, 5.3.5): the order of the round keys is reversed
+        and InvMixColumns is applied to all but the first and last.
+        """
+        SBox = self.SBox
+        Nk = len(key) // 4 # Number of columns of each block given the key length
+        round_words = [int.from_bytes(bytes(key[4*i : 4*i + 4]), 'big') for i in range(Nk)]
+        rcon = 1
+
+        for i in range(Nk, 4 * self.Nr + 4):
+            temp = round_words[i-1]
+            if i % Nk == 0:
+                temp = ((temp << 8) | (temp >> 24)) & 0xFFFFFFFF # RotWord
+                temp = (SBox[temp >> 24] << 24) | (SBox[(temp >> 16) & 0xFF] << 16) | (SBox[(temp >> 8) & 0xFF] << 8) | SBox[temp & 0xFF]
+                temp ^= rcon << 24 # XOR with Rcon
+                rcon = self.G_F.xTimes(rcon)
+            elif Nk > 6 and i % Nk == 4:
+                temp = (SBox[temp >> 24] << 24) | (SBox[(temp >> 16) & 0xFF] << 16) | (SBox[(temp >> 8) & 0xFF] << 8) | SBox[temp & 0xFF]
+            round_words.append(round_words[i - Nk] ^ temp)
+
+        Td0, Td1, Td2, Td3 = self.Td
+        inv_round_words = []
+        for i in range(self.Nr, -1, -1):
+            for word in round_words[4*i : 4*i + 4]:
+                if 0 < i < self.Nr:
+                    # Td[SBox[b]] is InvMixColumns applied to a single byte b
+                    word = Td0[SBox[word >> 24]] ^ Td1[SBox[(word >> 16) & 0xFF]] ^ \
+                           Td2[SBox[(word >> 8) & 0xFF]] ^ Td3[SBox[word & 0xFF]]
+                inv_round_words.append(word)
+        return round_words + inv_round_words
+
+
+    def TCipher(self, State):
+        """
+        Performs the AES encryption of one block with the T-table engine.
+        The state is a 128-bit integer holding the 16 bytes of the block in big-endian
+        order, so each of its four 32-bit words is one column of the FIPS 197 state.
+        """
+        Te0, Te1, Te2, Te3 = self.Te
+        rk = self.round_words
+        s0 = (State >> 96) ^ rk[0] # Initial round key addition
+        s1 = ((State >> 64) & 0xFFFFFFFF) ^ rk[1]
+        s2 = ((State >> 32) & 0xFFFFFFFF) ^ rk[2]
+        s3 = (State & 0xFFFFFFFF) ^ rk[3]
+
+        for k in range(4, 4 * self.Nr, 4):
+            # SubBytes, ShiftRows, MixColumns and AddRoundKey for each column
+            t0 = Te0[s0 >> 24] ^ Te1[(s1 >> 16) & 0xFF] ^ Te2[(s2 >> 8) & 0xFF] ^ Te3[s3 & 0xFF] ^ rk[k]
+            t1 = Te0[s1 >> 24] ^ Te1[(s2 >> 16) & 0xFF] ^ Te2[(s3 >> 8) & 0xFF] ^ Te3[s0 & 0xFF] ^ rk[k + 1]
+            t2 = Te0[s2 >> 24] ^ Te1[(s3 >> 16) & 0xFF] ^ Te2[(s0 >> 8) & 0xFF] ^ Te3[s1 & 0xFF] ^ rk[k + 2]
+            t3 = Te0[s3 >> 24] ^ Te1[(s0 >> 16) & 0xFF] ^ Te2[(s1 >> 8) & 0xFF] ^ Te3[s2 & 0xFF] ^ rk[k + 3]
+            s0, s1, s2, s3 = t0, t1, t2, t3
+
+        # Last round without MixColumns
+        S = self.SBox
+        k = 4 * self.Nr
+        t0 = ((S[s0 >> 24] << 24) | (S[(s1 >> 16) & 0xFF] << 16) | (S[(s2 >> 8) & 0xFF] << 8) | S[s3 & 0xFF]) ^ rk[k]
+        t1 = ((S[s1 >> 24] << 24) | (S[(s2 >> 16) & 0xFF] << 16) | (S[(s3 >> 8) & 0xFF] << 8) | S[s0 & 0xFF]) ^ rk[k + 1]
+        t2 = ((S[s2 >> 24] << 24) | (S[(s3 >> 16) & 0xFF] << 16) | (S[(s0 >> 8) & 0xFF] << 8) | S[s1 & 0xFF]) ^ rk[k + 2]
+        t3 = ((S[s3 >> 24] << 24) | (S[(s0 >> 16) & 0xFF] << 16) | (S[(s1 >> 8) & 0xFF] << 8) | S[s2 & 0xFF]) ^ rk[k + 3]
+        return (t0 << 96) | (t1 << 64) | (t2 << 32) | t3
+
+
+    def TInvCipher(self, State):
+        """
+        Performs the AES decryption of one block with the T-table engine.
+        Uses the equivalent inverse cipher, so every round has the same shape as in TCipher.
+        """
+        Td0, Td1, Td2, Td3 = self.Td
+        rk = self.inv_round_words
+        s0 = (State >> 96) ^ rk[0] # Initial round key addition
+        s1 = ((State >> 64) & 0xFFFFFFFF) ^ rk[1]
+        s2 = ((State >> 32) & 0xFFFFFFFF) ^ rk[2]
+        s3 = (State & 0xFFFFFFFF) ^ rk[3]
+
+        for k in range(4, 4 * self.Nr, 4):
+            # InvSubBytes, InvShiftRows, InvMixColumns and AddRoundKey for each column
+            t0 = Td0[s0 >> 24] ^ Td1[(s3 >> 16) & 0xFF] ^ Td2[(s2 >> 8) & 0xFF] ^ Td3[s1 & 0xFF] ^ rk[k]
+            t1 = Td0[s1 >> 24] ^ Td1[(s0 >> 16) & 0xFF] ^ Td2[(s3 >> 8) & 0xFF] ^ Td3[s2 & 0xFF] ^ rk[k + 1]
+            t2 = Td0[s2 >> 24] ^ Td1[(s1 >> 16) & 0xFF] ^ Td2[(s0 >> 8) & 0xFF] ^ Td3[s3 & 0xFF] ^ rk[k + 2]
+            t3 = Td0[s3 >> 24] ^ Td1[(s2 >> 16) & 0xFF] ^ Td2[(s1 >> 8) & 0xFF] ^ Td3[s0 & 0xFF] ^ rk[k + 3]
+            s0, s1, s2, s3 = t0, t1, t2, t3
+
+        # Last round without InvMixColumns
+        S = self.InvSBox
+        k = 4 * self.Nr
+        t0 = ((S[s0 >> 24] << 24) | (S[(s3 >> 16) & 0xFF] << 16) | (S[(s2 >> 8) & 0xFF] << 8) | S[s1 & 0xFF]) ^ rk[k]
+        t1 = ((S[s1 >> 24] << 24) | (S[(s0 >> 16) & 0xFF] << 16) | (S[(s3 >> 8) & 0xFF] << 8) | S[s2 & 0xFF]) ^ rk[k + 1]
+        t2 = ((S[s2 >> 24] << 24) | (S[(s1 >> 16) & 0xFF] << 16) | (S[(s0 >> 8) & 0xFF] << 8) | S[s3 & 0xFF]) ^ rk[k + 2]
+        t3 = ((S[s3 >> 24] << 24) | (S[(s2 >> 16) & 0xFF] << 16) | (S[(s1 >> 8) & 0xFF] << 8) | S[s0 & 0xFF]) ^ rk[k + 3]
+        return (t0 << 96) | (t1 << 64) | (t2 << 32) | t3
+
+
+    def _get_batch_tables(self):
+        """
+        Returns the NumPy tables used by the batch engine: SBox, InvSBox and the rows of the
+        products by 02, 03 (MixColumns) and 0e, 0b, 0d, 09 (InvMixColumns), which are shared
+        through the table cache, and the round keys of this instance as flat states.
+        """
+        tables = self._tables
+        if 'batch' not in tables:
+            with _tables_lock:
+                if 'batch' not in tables:
+                    SBox = np.frombuffer(self.SBox, dtype=np.uint8)
+                    InvSBox = np.frombuffer(self.InvSBox, dtype=np.uint8)
+                    mul = {n: np.frombuffer(self.G_F.fila(n), dtype=np.uint8) for n in (0x02, 0x03, 0x0e, 0x0b, 0x0d, 0x09)}
+                    for table in (SBox, InvSBox, *mul.values()):
+                        table.flags.writeable = False
+                    tables['batch'] = (SBox, InvSBox, mul)
+
+        if self._batch_round_keys is None:
+            self._batch_round_keys = np.array(self.round_words, dtype='>u4').view(np.uint8).reshape(-1, 16)
+        return tables['batch'] + (self._batch_round_keys,)
+
+
+    def CipherBatch(self, States):
+        """
+        Performs the AES encryption of N independent blocks at once with NumPy.
+        States is an (N, 16) uint8 array of flat states. Each round is applied to all the
+        blocks with a few vectorized operations: ShiftRows as a fixed permutation of the
+        columns of the array, SubBytes as a gather in SBox and MixColumns as gathers in the
+        precomputed product rows.
+        """
+        SBox, _, mul, round_keys = self._get_batch_tables()
+        m2, m3 = mul[0x02], mul[0x03]
+
+        States = States ^ round_keys[0] # Initial round key addition
+        for i in range(1, self.Nr):
+            States = SBox[States[:, SHIFT_ROWS]] # ShiftRows and SubBytes
+
+            # MixColumns, s0..s3 are the four rows of every column of every block
+            columns = States.reshape(-1, 4, 4)
+            s0, s1, s2, s3 = columns[:, :, 0], columns[:, :, 1], columns[:, :, 2], columns[:, :, 3]
+            mixed = np.empty_like(columns)
+            mixed[:, :, 0] = m2[s0] ^ m3[s1] ^ s2 ^ s3
+            mixed[:, :, 1] = s0 ^ m2[s1] ^ m3[s2] ^ s3
+            mixed[:, :, 2] = s0 ^ s1 ^ m2[s2] ^ m3[s3]
+            mixed[:, :, 3] = m3[s0] ^ s1 ^ s2 ^ m2[s3]
+            States = mixed.reshape(-1, 16)
+            States ^= round_keys[i]
+
+        States = SBox[States[:, SHIFT_ROWS]]
+        States ^= round_keys[self.Nr]
+        return States
+
+
+    def InvCipherBatch(self, States):
+        """
+        Performs the AES decryption of N independent blocks at once with NumPy.
+        States is an (N, 16) uint8 array of flat states. Each round is applied to all the
+        blocks with a few vectorized operations: InvShiftRows as a fixed permutation of the
+        columns of the array, InvSubBytes as a gather in InvSBox and InvMixColumns as gathers
+        in the precomputed product rows.
+        """
+        _, InvSBox, mul, round_keys = self._get_batch_tables()
+        me, mb, md, m9 = mul[0x0e], mul[0x0b], mul[0x0d], mul[0x09]
+
+        States = States ^ round_keys[self.Nr] # Initial round key addition
+        for i in range(self.Nr - 1, 0, -1):
+            States = InvSBox[States[:, INV_SHIFT_ROWS]] # InvShiftRows and InvSubBytes
+            States ^= round_keys[i]
+
+            # InvMixColumns, s0..s3 are the four rows of every column of every block
+            columns = States.reshape(-1, 4, 4)
+            s0, s1, s2, s3 = columns[:, :, 0], columns[:, :, 1], columns[:, :, 2], columns[:, :, 3]
+            mixed = np.empty_like(columns)
+            mixed[:, :, 0] = me[s0] ^ mb[s1] ^ md[s2] ^ m9[s3]
+            mixed[:, :, 1] = m9[s0] ^ me[s1] ^ mb[s2] ^ md[s3]
+            mixed[:, :, 2] = md[s0] ^ m9[s1] ^ me[s2] ^ mb[s3]
+            mixed[:, :, 3] = mb[s0] ^ md[s1] ^ m9[s2] ^ me[s3]
+            States = mixed.reshape(-1, 16)
+
+        States = InvSBox[States[:, INV_SHIFT_ROWS]]
+        States ^= round_keys[0]
+        return States
+
+
+    def _get_bitslice_tables(self):
+        """
+        Returns the circuit of the SBox for the bitsliced engine, shared through the table cache:
+        the low bits of the polynomial (used by xtime and the reduction of the products) and the
+        input bits of each output bit of the square, of the affine transformation and of its inverse.
+        All of them are linear maps over GF(2), given as tuples of input bits per output bit.
+        """
+        tables = self._tables
+        if 'bitslice' not in tables:
+            with _tables_lock:
+                if 'bitslice' not in tables:
+                    field = self.G_F
+                    reduction = tuple(i for i in range(8) if (field.polinomio_irreducible >> i) & 1)
+                    squares = [field.producto_lento(1 << i, 1 << i) for i in range(8)]
+                    images = [0] * 8 # Image of each bit under the affine transformation, without the constant
+                    for j, row in enumerate(self.affine_matrix): # Row j gives bit 7 - j
+                        for k in range(8):
+                            images[k] |= ((row >> k) & 1) << (7 - j)
+                    # Inverse of the linear map: the preimage of each bit, found among the 256 images
+                    linear = [0] * 256
+                    for n in range(256):
+                        linear[functools.reduce(int.__xor__, (images[k] for k in range(8) if (n >> k) & 1), 0)] = n
+                    inv_images = [linear[1 << k] for k in range(8)]
+
+                    def rows(images):
+                        return tuple(tuple(i for i in range(8) if (images[i] >> o) & 1) for o in range(8))
+                    tables['bitslice'] = (reduction, rows(squares), rows(images), rows(inv_images))
+        return tables['bitslice']
+
+
+    def _get_bitslice_round_keys(self, n):
+        """
+        Returns the round keys as planes of n blocks, each one the round key repeated n times.
+        The planes of the last n used are kept in the instance.
+        """
+        if self._bitslice_round_keys is None or self._bitslice_round_keys[0] != n:
+            round_keys = []
+            for r in range(self.Nr + 1):
+                words = self.round_words[4 * r : 4 * r + 4]
+                round_keys.append(blocks_to_planes(b''.join(w.to_bytes(4, 'big') for w in words) * n))
+            self._bitslice_round_keys = (n, round_keys)
+        return self._bitslice_round_keys[1]
+
+
+    def CipherBitsliced(self, data):
+        """
+        Encrypts the blocks of data (16 * N bytes) at once in the bitsliced engine and returns
+        them as a bytearray. The state is held in 8 planes (see blocks_to_planes) and every
+        transformation is a Boolean circuit on them, with no table indexed by the data:
+        SubBytes computes the inverse as x^254 with products of planes and then the affine
+        transformation, ShiftRows moves the segments of each row and MixColumns combines the
+        rows of each column (rotated with shifts of the planes) with xtime.
+        """
+        n = len(data) // 16
+        full, (row0, row1, row2, row3) = _bitslice_masks(n)
+        reduction, square, affine, _ = self._get_bitslice_tables()
+        round_keys = self._get_bitslice_round_keys(n)
+        shift = 4 * n
+        planes = [p ^ k for p, k in zip(blocks_to_planes(bytes(data)), round_keys[0])]
+
+        for i in range(1, self.Nr + 1):
+            # SubBytes
+            planes = _bitslice_linear(_bitslice_inverse(planes, reduction, square), affine, full, self.affine_const)
+            # ShiftRows: row r is rotated r columns to the left
+            planes = [(x & row0) | (((x << shift) | (x >> 3 * shift)) & row1)
+                      | (((x << 2 * shift) | (x >> 2 * shift)) & row2) | (((x << 3 * shift) | (x >> shift)) & row3)
+                      for x in planes]
+            if i != self.Nr:
+                # MixColumns: 02 * s0 ^ 03 * s1 ^ s2 ^ s3 = 02 * (s0 ^ s1) ^ s1 ^ s2 ^ s3 for every row
+                rotated = [((x << n) & (row0 | row1 | row2)) | ((x >> 3 * n) & row3) for x in planes] # s1
+                opposite = [((x << 2 * n) & (row0 | row1)) | ((x >> 2 * n) & (row2 | row3)) for x in planes] # s2
+                last = [((x << n) & (row0 | row1 | row2)) | ((x >> 3 * n) & row3) for x in opposite] # s3
+                doubled = _bitslice_xtime([x ^ y for x, y in zip(planes, rotated)], reduction)
+                planes = [a ^ b ^ c ^ d for a, b, c, d in zip(doubled, rotated, opposite, last)]
+            planes = [p ^ k for p, k in zip(planes, round_keys[i])]
+
+        return planes_to_blocks(planes, bytearray(len(data)))
+
+
+    def InvCipherBitsliced(self, data):
+        """
+        Decrypts the blocks of data (16 * N bytes) at once in the bitsliced engine and returns them
+        as a bytearray (see CipherBitsliced). InvMixColumns is MixColumns after multiplying the
+        column by 05 + 04 x^2, since (03 x^3 + x^2 + x + 02)(04 x^2 + 05) = 0b x^3 + 0d x^2 + 09 x + 0e
+        mod x^4 + 1 and none of these products needs a reduction, whatever the polynomial.
+        """
+        n = len(data) // 16
+        full, (row0, row1, row2, row3) = _bitslice_masks(n)
+        reduction, square, _, inv_affine = self._get_bitslice_tables()
+        round_keys = self._get_bitslice_round_keys(n)
+        shift = 4 * n
+        planes = [p ^ k for p, k in zip(blocks_to_planes(bytes(data)), round_keys[self.Nr])]
+
+        for i in range(self.Nr - 1, -1, -1):
+            # InvShiftRows: row r is rotated r columns to the right
+            planes = [(x & row0) | (((x >> shift) | (x << 3 * shift)) & row1)
+                      | (((x >> 2 * shift) | (x << 2 * shift)) & row2) | (((x >> 3 * shift) | (x << shift)) & row3)
+                      for x in planes]
+            # InvSubBytes: inverse of the affine transformation (constant first) and then the inverse in the field
+            constant = [p ^ full if (self.affine_const >> b) & 1 else p for b, p in enumerate(planes)]
+            planes = _bitslice_inverse(_bitslice_linear(constant, inv_affine), reduction, square)
+            planes = [p ^ k for p, k in zip(planes, round_keys[i])]
+            if i != 0:
+                # InvMixColumns: s ^= 04 * (s ^ s2) and then MixColumns
+                opposite = [((x << 2 * n) & (row0 | row1)) | ((x >> 2 * n) & (row2 | row3)) for x in planes]
+                quadrupled = _bitslice_xtime(_bitslice_xtime([x ^ y for x, y in zip(planes, opposite)], reduction), reduction)
+                planes = [x ^ y for x, y in zip(planes, quadrupled)]
+                rotated = [((x << n) & (row0 | row1 | row2)) | ((x >> 3 * n) & row3) for x in planes]
+                opposite = [((x << 2 * n) & (row0 | row1)) | ((x >> 2 * n) & (row2 | row3)) for x in planes]
+                last = [((x << n) & (row0 | row1 | row2)) | ((x >> 3 * n) & row3) for x in opposite]
+                doubled = _bitslice_xtime([x ^ y for x, y in zip(planes, rotated)], reduction)
+                planes = [a ^ b ^ c ^ d for a, b, c, d in zip(doubled, rotated, opposite, last)]
+
+        return planes_to_blocks(planes, bytearray(len(data)))
+
+
+    @_accepts_blocks
     def Cipher(self, State, Nr, Expanded_KEY): 
         """
-        Performs the AES encryption on the state.
+        Performs the AES encryption on the state (flat or 4x4 block).
         Applies a series of transformations for the specified number of rounds.
         """
         State = self.AddRoundKey(State, Expanded_KEY[0]) # Initial round key addition
@@ -405,9 +1659,10 @@ class AES:
         return State
 
 
+    @_accepts_blocks
     def InvCipher(self, State, Nr, Expanded_KEY): 
         """
-        Performs the AES decryption on the state.
+        Performs the AES decryption on the state (flat or 4x4 block).
         Applies the inverse transformations for the specified number of rounds.
         """
         State = self.AddRoundKey(State, Expanded_KEY[-1]) # Initial round key addition
@@ -422,6 +1677,26 @@ class AES:
         return State
 
 
+    @_accepts_blocks
+    def EqInvCipher(self, State, Nr, Expanded_KEY_Dec):
+        """
+        Performs the AES decryption on the state (flat or 4x4 block) with the equivalent inverse
+        cipher (FIPS 197, 5.3.5), given the round keys of KeyExpansionEIC (or expanded_key_dec).
+        The rounds have the same order as in Cipher, since InvMixColumns was already applied to
+        the round keys: InvSubBytes, InvShiftRows, InvMixColumns and AddRoundKey.
+        """
+        State = self.AddRoundKey(State, Expanded_KEY_Dec[Nr]) # Initial round key addition
+        for i in range(Nr - 1, 0, -1):
+            State = self.InvSubBytes(State)
+            State = self.InvShiftRows(State)
+            State = self.InvMixColumns(State)
+            State = self.AddRoundKey(State, Expanded_KEY_Dec[i])
+        State = self.InvSubBytes(State)
+        State = self.InvShiftRows(State)
+        State = self.AddRoundKey(State, Expanded_KEY_Dec[0])
+        return State
+
+
     def _add_padding(self, data, block_size=16):
         """
         Adds PKCS7 padding to the data to make its length a multiple of the block size.
@@ -433,6 +1708,26 @@ class AES:
         return data + padding
 
 
+    def _add_padding_in_place(self, view, size, block_size=16):
+        """
+        Writes the PKCS7 padding right after the first size bytes of the view.
+        Returns the padded size, always larger than size.
+        """
+        padding_length = block_size - (size % block_size) # 16 bytes of padding if size is a multiple of 16
+        view[size : size + padding_length] = bytes([padding_length]) * padding_length
+        return size + padding_length
+
+
+    def _padding_length(self, last_block, block_size=16):
+        """
+        Returns the length of the PKCS7 padding given the last decrypted block.
+        """
+        padding_length = last_block[-1] # Get padding length from last byte
+        if not 0 < padding_length <= block_size:
+            raise ValueError("Invalid PKCS7 padding")
+        return padding_length
+
+
     def _array_to_block(self, array, row=4, col=4):
         """
         Converts a one-dimensional array into a 4x4 block format (list of lists).
@@ -459,7 +1754,119 @@ class AES:
         return array
 
 
-    def encrypt_file(self, file): 
+    def _read_chunk(self, file, view):
+        """
+        Reads from the file until the view is full or the end of the file is reached.
+        Returns the number of bytes read.
+        """
+        total = 0
+        while total < len(view):
+            n = file.readinto(view[total:])
+            if not n:
+                break
+            total += n
+        return total
+
+
+    def _block_engine(self):
+        """
+        Returns the engine used for the modes that encrypt one block at a time.
+        """
+        return self.engine or select_engines()['block']
+
+
+    def _batch_engine(self, blocks):
+        """
+        Returns the engine used to transform a given number of independent blocks at once.
+        """
+        if self.engine is not None:
+            return self.engine
+        batch = select_engines()['batch']
+        selected = batch[0][1]
+        for min_blocks, engine in batch:
+            if blocks >= min_blocks:
+                selected = engine
+        return selected
+
+
+    def encrypt_blocks(self, data, out=None):
+        """
+        Input: N blocks (16 * N bytes) in any object supporting the buffer protocol.
+        Output: the blocks encrypted independently of each other (ECB), in a single call to the
+        fastest engine for N blocks. The result is written into out if it is given (a writable
+        buffer of the same size, which can be data itself), otherwise a new bytearray is returned.
+        """
+        return self._transform_blocks(data, out, 'encrypt_blocks')
+
+
+    def decrypt_blocks(self, data, out=None):
+        """
+        Input: N blocks (16 * N bytes) in any object supporting the buffer protocol.
+        Output: the blocks decrypted independently of each other (ECB), as in encrypt_blocks.
+        """
+        return self._transform_blocks(data, out, 'decrypt_blocks')
+
+
+    def _transform_blocks(self, data, out, method):
+        """
+        Copies data into out (unless they are the same object) and transforms it in place with
+        the given method of the batch engine.
+        """
+        view = memoryview(data).cast('B')
+        if len(view) % 16:
+            raise ValueError("The data must be a whole number of 16-byte blocks")
+        if out is None:
+            out = bytearray(view)
+        elif out is not data:
+            out_view = memoryview(out).cast('B')
+            if len(out_view) != len(view):
+                raise ValueError("The output buffer must have the same size as the data")
+            out_view[:] = view
+        if len(view):
+            getattr(self._batch_engine(len(view) // 16), method)(self, memoryview(out).cast('B'))
+        return out
+
+
+    def _cbc_encrypt(self, view, prev_block):
+        """
+        Encrypts in place the full blocks of the view using CBC.
+        prev_block is the chaining value as a 128-bit integer (the IV for the first call)
+        and the last encrypted block is returned to continue the chain on the next call.
+        """
+        encrypt_block = self._block_engine().encrypt_block
+        for i in range(0, len(view), 16):
+            prev_block = encrypt_block(self, int.from_bytes(view[i:i+16], 'big') ^ prev_block) # XOR with previous block and encrypt
+            view[i:i+16] = prev_block.to_bytes(16, 'big') # Store encrypted block in place
+        return prev_block
+
+
+    def _cbc_decrypt(self, view, prev_block, out=None):
+        """
+        Decrypts the full blocks of the view using CBC into out, a writable buffer of the same
+        size that must not overlap the view, or in place if out is not given.
+        prev_block is the chaining value as a 128-bit integer (the IV for the first call)
+        and the last ciphertext block is returned to continue the chain on the next call.
+        Decryption of the blocks has no chain dependency, so all of them are inverted at once
+        and then XORed with the previous ciphertext block, straight from the ciphertext buffer.
+        Decrypting in place needs a copy of the ciphertext, into a separate out it does not.
+        """
+        size = len(view)
+        if not size:
+            return prev_block
+        last_block = int.from_bytes(view[size - 16:], 'big')
+        if out is None:
+            ciphertext = bytes(view) # Still needed for the chain once the view is decrypted
+            out = view
+        else:
+            ciphertext = view
+        self.decrypt_blocks(view, out)
+
+        _xor_into(out[:16], prev_block.to_bytes(16, 'big'))
+        _xor_into(out[16:], ciphertext[:size - 16]) # Each block with the previous ciphertext block
+        return last_block
+
+
+    def encrypt_file(self, file, chunk_size=CHUNK_SIZE, use_mmap=False): 
         """
         Input: Name of the file to encrypt
         Output: File encrypted using the key provided in the class constructor.
@@ -468,33 +1875,36 @@ class AES:
         The padding used will be PKCS7.
         The encrypted file name will be the original file name with the suffix .enc added:
         FileName --> FileName.enc
+        The file is processed in chunks of chunk_size bytes, so the memory used does not
+        depend on its size. With use_mmap both files are memory-mapped and the blocks are
+        encrypted in place in the output file.
         """
-
-        with open(file, 'rb') as data:
-            blocks = self._split_into_blocks(data.read()) # Read and split data into blocks
-
+        chunk_size = max(16, chunk_size - chunk_size % 16) # Chunks of full blocks
         IV = os.urandom(16) # Generate random IV
-        iv_block = self._array_to_block(IV) # Convert IV to block format
+        encrypted_filename = file + '.enc' # Create encrypted file name
+        if use_mmap:
+            self._encrypt_file_mmap(file, encrypted_filename, IV, chunk_size)
+            return
 
-        cipher_blocks = []
-        prev_block = iv_block # Initialize previous block with IV
+        buffer = bytearray(chunk_size + 16) # Room for one extra block of padding
+        view = memoryview(buffer)
+        prev_block = int.from_bytes(IV, 'big') # Initialize previous block with IV
 
-        for block in blocks:
-            xor_block = self.AddRoundKey(block, prev_block) # XOR with previous block
-            encrypted_block = self.Cipher(xor_block, self.Nr, self.expanded_key) # Encrypt block
-            cipher_blocks.append(encrypted_block) # Store encrypted block
-            prev_block = encrypted_block
+        with open(file, 'rb') as data, open(encrypted_filename, 'wb') as enc_file:
+            enc_file.write(IV) # Write IV to file
+            size = self._read_chunk(data, view[:chunk_size])
+            while size == chunk_size:
+                prev_block = self._cbc_encrypt(view[:size], prev_block)
+                enc_file.write(view[:size])
+                size = self._read_chunk(data, view[:chunk_size])
 
-        encrypted_filename = file + '.enc' # Create encrypted file name
-        with open(encrypted_filename, 'wb') as enc_file:
-            enc_file.write(bytes(IV)) # Write IV to file
-            for block in cipher_blocks:
-                for i in range(4):
-                    col = [row[i] for row in block]
-                    enc_file.write(bytes([number for number in col]))
+            # Last chunk, shorter than chunk_size (possibly empty)
+            size = self._add_padding_in_place(view, size) # PKCS7 padding
+            self._cbc_encrypt(view[:size], prev_block)
+            enc_file.write(view[:size])
 
 
-    def decrypt_file(self, file): 
+    def decrypt_file(self, file, chunk_size=CHUNK_SIZE, processes=None, use_mmap=False): 
         """
         Input: Name of the file to decrypt
         Output: File decrypted using the key provided in the class constructor.
@@ -503,37 +1913,808 @@ class AES:
         will be removed.
         The decrypted file name will be the original file name with the suffix .dec added:
         FileName --> FileName.dec
+        The file is processed in chunks of chunk_size bytes, so the memory used does not
+        depend on its size. With use_mmap both files are memory-mapped and the blocks are
+        decrypted in place in the output file. With processes > 1 (which implies use_mmap)
+        the blocks are split in contiguous shards decrypted in parallel by that many worker
+        processes.
         """
+        chunk_size = max(16, chunk_size - chunk_size % 16) # Chunks of full blocks
+        decrypted_filename = file + '.dec' # Create decrypted file name
+        if use_mmap or (processes and processes > 1):
+            self._decrypt_file_mmap(file, decrypted_filename, chunk_size, processes or 1)
+            return
 
+        view = memoryview(bytearray(chunk_size)) # Ciphertext read from the file
+        out = memoryview(bytearray(chunk_size)) # Decrypted data, the ciphertext is not copied
         with open(file, 'rb') as enc_file:
-            # Read and split file into 4x4 blocks and
-            # transpose it so that it is in columns
-            blocks = self._split_into_blocks(enc_file.read(), add_padding=False) 
-        
-        iv_block = blocks[0] # The first block is the IV
-        encrypted_blocks = blocks[1:] # Remaining blocks are the encrypted data
-
-        decrypted_blocks = []
-        prev_block = iv_block # Initialize previous block with IV
-
-        # Decrypt each block using CBC 
-        for block in encrypted_blocks:
-            decrypted_block = self.InvCipher(copy.deepcopy(block), self.Nr, self.expanded_key) # Decrypt block
-            original_block = self.AddRoundKey(decrypted_block, prev_block) # XOR with previous block
-            decrypted_blocks.append(original_block) # Store original block
-            prev_block = block
-
-        Bytes = []
-        for block in decrypted_blocks: 
-            for i in range(4):
-                col = [row[i] for row in block] # Extract column
-                Bytes.append(bytes([number for number in col])) # Convert to bytes and store
-        decrypted_data = b''.join(Bytes) # Join all bytes into a single byte string
+            # Checked before creating the output file, like the other paths
+            encrypted_size = os.fstat(enc_file.fileno()).st_size - 16 # Without the IV
+            if encrypted_size < 16 or encrypted_size % 16:
+                raise ValueError("Invalid length of encrypted data")
+            prev_block = int.from_bytes(enc_file.read(16), 'big') # The first block is the IV
+
+            with open(decrypted_filename, 'wb') as dec_file:
+                # The last decrypted block is held back until the end of the file is reached,
+                # because it is the one that contains the padding
+                last_block = b''
+                while True:
+                    size = self._read_chunk(enc_file, view)
+                    if not size:
+                        break
+                    prev_block = self._cbc_decrypt(view[:size], prev_block, out[:size])
+                    dec_file.write(last_block)
+                    dec_file.write(out[:size - 16])
+                    last_block = bytes(out[size - 16:size])
+
+                # Remove PKCS7 padding
+                dec_file.write(last_block[:16 - self._padding_length(last_block)])
+
+
+    def _encrypt_file_mmap(self, file, encrypted_filename, IV, chunk_size):
+        """
+        Encrypts the file in CBC mode through memory maps. The output file is preallocated to
+        its final size (IV and padded data) and every chunk is copied once from the input map
+        to the output map and encrypted there in place; only the last partial block is
+        handled separately to add the padding.
+        """
+        size = os.path.getsize(file)
+        full_size = size - size % 16 # Size of the full blocks
+        prev_block = int.from_bytes(IV, 'big') # Initialize previous block with IV
+
+        with open(file, 'rb') as data, open(encrypted_filename, 'w+b') as enc_file:
+            enc_file.truncate(16 + full_size + 16)
+            with mmap.mmap(enc_file.fileno(), 0) as enc_map:
+                out = memoryview(enc_map)
+                out[:16] = IV # Write IV to file
+                if size:
+                    with mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ) as data_map:
+                        view = memoryview(data_map)
+                        for pos in range(0, full_size, chunk_size):
+                            n = min(chunk_size, full_size - pos)
+                            out[16 + pos : 16 + pos + n] = view[pos : pos + n]
+                            prev_block = self._cbc_encrypt(out[16 + pos : 16 + pos + n], prev_block)
+                        out[16 + full_size : 16 + size] = view[full_size:size] # Last partial block
+                        view.release()
+
+                self._add_padding_in_place(out[16 + full_size:], size - full_size) # PKCS7 padding
+                self._cbc_encrypt(out[16 + full_size:], prev_block)
+                out.release()
+
+
+    def _decrypt_file_mmap(self, file, decrypted_filename, chunk_size, processes=1):
+        """
+        Decrypts the file in CBC mode through memory maps, optionally with a pool of worker
+        processes. Decrypting a block only needs the block itself and the previous one, so the
+        blocks are split in one contiguous shard per process, each one chained to the ciphertext
+        block that precedes it (the IV for the first shard). The parent reads those chaining
+        blocks and preallocates the output file; each shard is decrypted in place in the mapped
+        output file, so the data is never sent between processes. Finally the parent removes
+        the PKCS7 padding truncating the output file.
+        """
+        size = os.path.getsize(file) - 16 # Without the IV
+        if size < 16 or size % 16:
+            raise ValueError("Invalid length of encrypted data")
+        blocks = size // 16
+        shard_size = -(-blocks // processes)
 
-        # Remove PKCS7 padding
-        padding_length = decrypted_data[-1] # Get padding length from last byte
-        decrypted_data = decrypted_data[:-padding_length] # Remove padding
+        with open(file, 'rb') as enc_file:
+            shards = []
+            for first in range(0, blocks, shard_size):
+                enc_file.seek(16 * first)
+                prev_block = int.from_bytes(enc_file.read(16), 'big') # The IV for the first shard
+                shards.append((first, min(shard_size, blocks - first), prev_block))
 
-        decrypted_filename = file + '.dec' # Create decrypted file name
         with open(decrypted_filename, 'wb') as dec_file:
-            dec_file.write(decrypted_data)
+            dec_file.truncate(size)
+
+        pool = _process_pool(len(shards)) if len(shards) > 1 else None
+        if pool is None:
+            for shard in shards:
+                self._cbc_decrypt_shard(file, decrypted_filename, *shard, chunk_size)
+        else:
+            key = self.key # Private copy taken in __init__
+            engine = self.engine.name if self.engine else None
+            with pool:
+                futures = [pool.submit(_cbc_decrypt_shard_worker, key, self._variant, engine, file,
+                                       decrypted_filename, first, count, prev_block, chunk_size)
+                           for first, count, prev_block in shards]
+                for future in futures:
+                    future.result()
+
+        # Remove PKCS7 padding
+        with open(decrypted_filename, 'r+b') as dec_file:
+            dec_file.seek(size - 16)
+            dec_file.truncate(size - self._padding_length(dec_file.read(16)))
+
+
+    def _cbc_decrypt_shard(self, file, decrypted_filename, first, count, prev_block, chunk_size):
+        """
+        Decrypts count blocks of the file starting at block first (not counting the IV) into
+        the same position of the already allocated output file, both mapped with mmap.
+        Each chunk is decrypted from the input map straight into the output map.
+        """
+        with open(file, 'rb') as enc_file, open(decrypted_filename, 'r+b') as dec_file, \
+             mmap.mmap(enc_file.fileno(), 0, access=mmap.ACCESS_READ) as enc_map, \
+             mmap.mmap(dec_file.fileno(), 0) as dec_map:
+            view, out = memoryview(enc_map), memoryview(dec_map)
+            start, end = 16 * first, 16 * (first + count)
+            for pos in range(start, end, chunk_size):
+                n = min(chunk_size, end - pos)
+                prev_block = self._cbc_decrypt(view[16 + pos : 16 + pos + n], prev_block, out[pos : pos + n]) # Skip the IV
+            view.release()
+            out.release()
+            dec_map.flush()
+
+
+    def encrypt_bytes_into(self, data, out, IV=None):
+        """
+        Input: data to encrypt, any object supporting the buffer protocol (it is not copied),
+        and out, a writable buffer (bytearray, memoryview...) of at least 16 + padded size bytes.
+        Output: Number of bytes written to out.
+        The result has the same format as the files written by encrypt_file: the IV (random
+        unless given) in the first 16 bytes, followed by the data encrypted in CBC mode with
+        PKCS7 padding.
+        """
+        data = memoryview(data).cast('B')
+        out = memoryview(out).cast('B')
+        size = len(data)
+        total = 16 + size + 16 - (size % 16)
+        if len(out) < total:
+            raise ValueError(f"Output buffer too small, {total} bytes needed")
+
+        IV = os.urandom(16) if IV is None else bytes(IV) # Generate random IV
+        out[:16] = IV
+        out[16 : 16 + size] = data
+        self._add_padding_in_place(out[16:total], size) # PKCS7 padding
+        self._cbc_encrypt(out[16:total], int.from_bytes(IV, 'big'))
+        return total
+
+
+    def decrypt_bytes_into(self, data, out):
+        """
+        Input: data to decrypt in the format written by encrypt_bytes_into or encrypt_file,
+        any object supporting the buffer protocol (it is not copied), and out, a writable
+        buffer of at least len(data) - 16 bytes.
+        Output: Number of bytes of decrypted data written to out, without the padding.
+        """
+        data = memoryview(data).cast('B')
+        out = memoryview(out).cast('B')
+        size = len(data) - 16
+        if size < 16 or size % 16:
+            raise ValueError("Invalid length of encrypted data")
+        if len(out) < size:
+            raise ValueError(f"Output buffer too small, {size} bytes needed")
+
+        out[:size] = data[16:] # Decrypted in place, out may share memory with data
+        self._cbc_decrypt(out[:size], int.from_bytes(data[:16], 'big')) # The first block is the IV
+        return size - self._padding_length(out[size - 16 : size])
+
+
+    def encrypt_bytes(self, data, IV=None):
+        """
+        Input: data to encrypt, any object supporting the buffer protocol.
+        Output: bytearray with the IV followed by the encrypted data (see encrypt_bytes_into).
+        """
+        size = memoryview(data).nbytes
+        out = bytearray(16 + size + 16 - (size % 16))
+        self.encrypt_bytes_into(data, out, IV)
+        return out
+
+
+    def decrypt_bytes(self, data):
+        """
+        Input: data to decrypt, any object supporting the buffer protocol.
+        Output: bytearray with the decrypted data (see decrypt_bytes_into).
+        """
+        out = bytearray(max(0, memoryview(data).nbytes - 16))
+        size = self.decrypt_bytes_into(data, out)
+        del out[size:]
+        return out
+
+
+    def encryptor(self, IV=None):
+        """
+        Returns a CBCEncryptor to encrypt data that arrives in pieces of any size, with the
+        IV given (16 bytes) or a random one. The concatenation of the outputs of its update
+        and finalize is the same as encrypt_bytes of the whole data.
+        """
+        IV = os.urandom(16) if IV is None else bytes(IV)
+        if len(IV) != 16:
+            raise ValueError("The IV must have 16 bytes")
+        return CBCEncryptor(self, IV)
+
+
+    def decryptor(self):
+        """
+        Returns a CBCDecryptor to decrypt data in the format of encrypt_bytes (or of the files
+        written by encrypt_file) that arrives in pieces of any size.
+        """
+        return CBCDecryptor(self)
+
+
+    def open_encrypted(self, file, cache_blocks=256):
+        """
+        Input: Name of a file written by encrypt_file.
+        Output: CBCFileReader to read any range of the decrypted data with seek/read/pread,
+        decrypting only the blocks of the range and keeping up to cache_blocks decrypted
+        blocks in an LRU cache. It can be used as a context manager to close the file.
+        """
+        return CBCFileReader(self, file, cache_blocks)
+
+
+    def _ctr_keystream_blocks(self, counter, count, counter_bits=128):
+        """
+        Generates count blocks of CTR keystream, encrypting the counter blocks counter, counter + 1, ...
+        Only the low counter_bits bits are incremented (modulo 2^counter_bits), the rest of the
+        block is fixed: 128 for CTR mode and 32 for GCM (inc32).
+        """
+        mask = (1 << counter_bits) - 1
+        prefix = counter & ~mask
+        counters = b''.join([(prefix | ((counter + j) & mask)).to_bytes(16, 'big') for j in range(count)])
+        return self.encrypt_blocks(counters)
+
+
+    def _ctr_keystream(self, counter, offset, length, pool=None, shards=1, counter_bits=128):
+        """
+        Returns length bytes of the keystream that starts with the counter block counter,
+        skipping the first offset bytes. Only the blocks that cover the range are generated.
+        If a process pool is given the blocks are split into shards generated in parallel.
+        """
+        first = offset // 16
+        skip = offset % 16
+        count = (skip + length + 15) // 16
+        mask = (1 << counter_bits) - 1
+        counter = (counter & ~mask) | ((counter + first) & mask)
+
+        if pool is None or count < 2 * shards:
+            keystream = self._ctr_keystream_blocks(counter, count, counter_bits)
+        else:
+            shard_size = -(-count // shards)
+            key = self.key # Private copy taken in __init__
+            engine = self.engine.name if self.engine else None
+            futures = [pool.submit(_ctr_keystream_worker, key, self._variant, engine,
+                                   (counter & ~mask) | ((counter + start) & mask), min(shard_size, count - start), counter_bits)
+                       for start in range(0, count, shard_size)]
+            keystream = b''.join([future.result() for future in futures])
+        return memoryview(keystream)[skip : skip + length]
+
+
+    def _ctr_counter(self, nonce):
+        """
+        Returns the first counter block for the nonce: a nonce of up to 16 bytes followed by
+        zeros, the low bytes being the counter incremented for every block (NIST SP 800-38A, B.1).
+        """
+        nonce = bytes(nonce)
+        if len(nonce) > 16:
+            raise ValueError("The nonce can not be longer than 16 bytes")
+        return int.from_bytes(nonce.ljust(16, b'\0'), 'big')
+
+
+    def ctr_keystream(self, nonce, offset, length):
+        """
+        Returns length bytes of the CTR keystream for the nonce starting at byte offset,
+        without generating the keystream of the previous bytes.
+        """
+        return bytes(self._ctr_keystream(self._ctr_counter(nonce), offset, length))
+
+
+    def encrypt_ctr(self, data, nonce, offset=0, processes=None):
+        """
+        Input: data to encrypt (any object supporting the buffer protocol), the nonce and the
+        offset of data in the stream, so any part of a stream can be processed on its own.
+        Output: bytearray with data XORed with the CTR keystream (NIST SP 800-38A, 6.5).
+        The keystream is generated in batches of CHUNK_SIZE bytes; with processes > 1 each
+        batch is split between that many worker processes.
+        As in any CTR mode, a nonce must never be reused with the same key.
+        """
+        return self._ctr_apply(data, self._ctr_counter(nonce), offset, processes)
+
+
+    decrypt_ctr = encrypt_ctr # In CTR mode decryption is the same operation as encryption
+
+
+    def _ctr_apply(self, data, counter, offset=0, processes=None, counter_bits=128):
+        """
+        Returns a bytearray with data XORed with the keystream of the counter block counter,
+        data being at byte offset of the stream (see encrypt_ctr and _ctr_keystream).
+        """
+        data = memoryview(data).cast('B')
+        out = bytearray(len(data))
+        shards = processes if processes and processes > 1 and len(data) > CHUNK_SIZE else 1
+        step = CHUNK_SIZE * shards
+
+        pool = _process_pool(shards) if shards > 1 else None
+        try:
+            for pos in range(0, len(data), step):
+                n = min(step, len(data) - pos)
+                keystream = self._ctr_keystream(counter, offset + pos, n, pool, shards, counter_bits)
+                out[pos : pos + n] = (int.from_bytes(data[pos : pos + n], 'big') ^ int.from_bytes(keystream, 'big')).to_bytes(n, 'big')
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return out
+
+
+    def _gcm_start(self, IV, aad):
+        """
+        Returns the pre-counter block J0 of the IV, the first counter block inc32(J0) and a
+        GHASH that has already absorbed the AAD (NIST SP 800-38D, 7.1). An IV of 12 bytes is
+        used directly, any other length is hashed with GHASH.
+        """
+        IV = bytes(IV)
+        if not IV:
+            raise ValueError("The IV can not be empty")
+        if self._ghash_tables is None:
+            H = self._block_engine().encrypt_block(self, 0) # Hash subkey, the encryption of the zero block
+            self._ghash_tables = GHASH.make_tables(H)
+
+        if len(IV) == 12:
+            J0 = int.from_bytes(IV + b'\0\0\0\1', 'big')
+        else:
+            ghash = GHASH(self._ghash_tables)
+            ghash.update(IV)
+            ghash.pad()
+            ghash.update((8 * len(IV)).to_bytes(16, 'big'))
+            J0 = ghash.state
+        counter = (J0 & ~0xFFFFFFFF) | ((J0 + 1) & 0xFFFFFFFF)
+
+        ghash = GHASH(self._ghash_tables)
+        ghash.update(aad)
+        ghash.pad()
+        return J0, counter, ghash
+
+
+    def _gcm_tag(self, J0, ghash, aad_length, length, tag_length):
+        """
+        Completes GHASH with the lengths in bits of the AAD and the ciphertext and returns
+        the first tag_length bytes of its result encrypted with J0.
+        """
+        ghash.pad()
+        ghash.update(((8 * aad_length) << 64 | (8 * length)).to_bytes(16, 'big'))
+        tag = self._block_engine().encrypt_block(self, J0) ^ ghash.state
+        return tag.to_bytes(16, 'big')[:tag_length]
+
+
+    def _check_tag_length(self, tag_length):
+        if tag_length not in GCM_TAG_LENGTHS:
+            raise ValueError(f"Invalid tag length {tag_length}, it must be one of {GCM_TAG_LENGTHS}")
+
+
+    def _check_gcm_length(self, length):
+        # Beyond this limit the 32-bit counter would wrap around and reuse the block of J0
+        if length > GCM_MAX_LENGTH:
+            raise ValueError(f"Data too long for GCM, at most {GCM_MAX_LENGTH} bytes can be encrypted with one IV")
+
+
+    def encrypt_gcm(self, data, IV, aad=b'', tag_length=16, processes=None):
+        """
+        Input: data to encrypt (any object supporting the buffer protocol), the IV (12 bytes
+        recommended, it must never be reused with the same key) and the additional data that
+        is authenticated but not encrypted.
+        Output: (ciphertext, tag) with GCM (NIST SP 800-38D): the data is encrypted with the CTR
+        keystream of inc32(J0), in parallel with processes > 1 as encrypt_ctr, and the tag of
+        tag_length bytes authenticates the AAD and the ciphertext.
+        """
+        self._check_tag_length(tag_length)
+        data = memoryview(data).cast('B')
+        self._check_gcm_length(len(data))
+        aad = bytes(aad)
+        J0, counter, ghash = self._gcm_start(IV, aad)
+        out = self._ctr_apply(data, counter, 0, processes, counter_bits=32)
+        ghash.update(out)
+        return out, self._gcm_tag(J0, ghash, len(aad), len(out), tag_length)
+
+
+    def decrypt_gcm(self, data, IV, tag, aad=b'', processes=None):
+        """
+        Input: ciphertext, IV, tag and additional data as given or used by encrypt_gcm.
+        Output: bytearray with the decrypted data. The tag is checked before decrypting and
+        ValueError is raised if it does not match, so no unauthenticated data is returned.
+        """
+        tag = bytes(tag)
+        self._check_tag_length(len(tag))
+        data = memoryview(data).cast('B')
+        self._check_gcm_length(len(data))
+        aad = bytes(aad)
+        J0, counter, ghash = self._gcm_start(IV, aad)
+        ghash.update(data)
+        if not hmac.compare_digest(self._gcm_tag(J0, ghash, len(aad), len(data), len(tag)), tag):
+            raise ValueError("The authentication tag does not match, the data or the AAD were modified")
+        return self._ctr_apply(data, counter, 0, processes, counter_bits=32)
+
+
+    def encrypt_file_gcm(self, file, aad=b'', chunk_size=CHUNK_SIZE):
+        """
+        Input: Name of the file to encrypt and the additional data to authenticate with it.
+        Output: File encrypted and authenticated with GCM in a single pass, with a random IV of
+        12 bytes at the beginning and the tag of 16 bytes at the end:
+        FileName --> FileName.gcm
+        The file is processed in chunks of chunk_size bytes, which are encrypted and then
+        absorbed by GHASH before being written. Files longer than GCM_MAX_LENGTH are rejected.
+        """
+        chunk_size = max(16, chunk_size - chunk_size % 16) # Chunks of full blocks
+        self._check_gcm_length(os.path.getsize(file))
+        aad = bytes(aad)
+        IV = os.urandom(12)
+        J0, counter, ghash = self._gcm_start(IV, aad)
+        view = memoryview(bytearray(chunk_size))
+        length = 0
+
+        with open(file, 'rb') as data, open(file + '.gcm', 'wb') as enc_file:
+            enc_file.write(IV)
+            size = chunk_size
+            while size == chunk_size:
+                size = self._read_chunk(data, view)
+                self._check_gcm_length(length + size) # In case the file grew after it was checked
+                encrypted = self._ctr_apply(view[:size], counter, length, counter_bits=32)
+                ghash.update(encrypted)
+                enc_file.write(encrypted)
+                length += size
+            enc_file.write(self._gcm_tag(J0, ghash, len(aad), length, 16))
+
+
+    def decrypt_file_gcm(self, file, aad=b'', chunk_size=CHUNK_SIZE):
+        """
+        Input: Name of a file encrypted with encrypt_file_gcm and the same additional data.
+        Output: File decrypted in a single pass, with the suffix .dec added:
+        FileName --> FileName.dec
+        The tag can only be checked at the end, so the data is decrypted into a temporary file
+        in the same directory, renamed to FileName.dec only if the tag matches. Otherwise, or if
+        anything fails before, the temporary file is removed (and ValueError is raised if the
+        tag does not match), so unauthenticated data never appears under the output name.
+        """
+        chunk_size = max(16, chunk_size - chunk_size % 16)
+        aad = bytes(aad)
+        decrypted_filename = file + '.dec'
+        temp_name = f'{decrypted_filename}.{os.getpid()}.{threading.get_ident()}.tmp'
+        remaining = os.path.getsize(file) - 12 - 16 # Without the IV and the tag
+        if remaining < 0:
+            raise ValueError("The file is too short to have been encrypted with GCM")
+        self._check_gcm_length(remaining)
+        view = memoryview(bytearray(chunk_size))
+        length = 0
+
+        try:
+            with open(file, 'rb') as enc_file, open(temp_name, 'wb') as dec_file:
+                J0, counter, ghash = self._gcm_start(enc_file.read(12), aad)
+                while remaining > 0:
+                    size = self._read_chunk(enc_file, view[:min(chunk_size, remaining)])
+                    if size == 0: # The file was truncated while being read
+                        break
+                    ghash.update(view[:size])
+                    dec_file.write(self._ctr_apply(view[:size], counter, length, counter_bits=32))
+                    length += size
+                    remaining -= size
+                tag = enc_file.read(16)
+
+            if not hmac.compare_digest(self._gcm_tag(J0, ghash, len(aad), length, 16), tag):
+                raise ValueError("The authentication tag does not match, the file or the AAD were modified")
+            os.replace(temp_name, decrypted_filename)
+        finally:
+            try:
+                os.remove(temp_name) # Only left if the tag did not match or the decryption failed
+            except FileNotFoundError:
+                pass
+
+
+class Engine(ABC):
+    """
+    Base class of the engines that run the block cipher for the AES class.
+    encrypt_block/decrypt_block transform one block given as a 128-bit integer (used by the
+    chained modes) and encrypt_blocks/decrypt_blocks transform in place all the blocks of a
+    writable buffer (used by the modes whose blocks are independent). By default the latter
+    just loop over the former.
+    """
+
+    name = None
+
+    def available(self):
+        """
+        Returns whether the engine can run on this host.
+        """
+        return True
+
+    @abstractmethod
+    def encrypt_block(self, aes, block):
+        """
+        Returns the block (128-bit integer) encrypted with the round keys of aes.
+        """
+
+    @abstractmethod
+    def decrypt_block(self, aes, block):
+        """
+        Returns the block (128-bit integer) decrypted with the round keys of aes.
+        """
+
+    def encrypt_blocks(self, aes, view):
+        encrypt_block = self.encrypt_block
+        for i in range(0, len(view), 16):
+            view[i:i+16] = encrypt_block(aes, int.from_bytes(view[i:i+16], 'big')).to_bytes(16, 'big')
+
+    def decrypt_blocks(self, aes, view):
+        decrypt_block = self.decrypt_block
+        for i in range(0, len(view), 16):
+            view[i:i+16] = decrypt_block(aes, int.from_bytes(view[i:i+16], 'big')).to_bytes(16, 'big')
+
+
+ENGINES = {} # Registered engines by name
+_engine_selection = None # Result of select_engines, once per process
+_engine_lock = threading.RLock()
+
+
+def register_engine(engine):
+    """
+    Adds an engine (class or instance) to the registry, so that it can be chosen by name and
+    is considered by the automatic selection. Can be used as a class decorator.
+    """
+    global _engine_selection
+    instance = engine() if isinstance(engine, type) else engine
+    with _engine_lock:
+        ENGINES[instance.name] = instance
+        _engine_selection = None # Select again including the new engine
+    return engine
+
+
+def get_engine(name):
+    """
+    Returns the registered engine with the given name, if it can run on this host.
+    """
+    engine = ENGINES.get(name)
+    if engine is None:
+        raise ValueError(f"Unknown engine {name!r}, the registered ones are {', '.join(ENGINES)}")
+    if not engine.available():
+        raise ValueError(f"The engine {name!r} is not available on this host")
+    return engine
+
+
+@register_engine
+class ReferenceEngine(Engine):
+    """
+    The FIPS 197 transformations (Cipher, EqInvCipher) applied one after the other on a flat state.
+    """
+
+    name = 'reference'
+
+    def encrypt_block(self, aes, block):
+        State = aes.Cipher(bytearray(block.to_bytes(16, 'big')), aes.Nr, aes.expanded_key)
+        return int.from_bytes(State, 'big')
+
+    def decrypt_block(self, aes, block):
+        State = aes.EqInvCipher(bytearray(block.to_bytes(16, 'big')), aes.Nr, aes.expanded_key_dec)
+        return int.from_bytes(State, 'big')
+
+
+@register_engine
+class TTableEngine(Engine):
+    """
+    Rounds as table lookups and XORs on 32-bit column words (TCipher, TInvCipher).
+    """
+
+    name = 'ttable'
+
+    def encrypt_block(self, aes, block):
+        return aes.TCipher(block)
+
+    def decrypt_block(self, aes, block):
+        return aes.TInvCipher(block)
+
+
+@register_engine
+class NumpyEngine(Engine):
+    """
+    All the blocks of a buffer transformed at once with vectorized NumPy operations (CipherBatch, InvCipherBatch).
+    """
+
+    name = 'numpy'
+
+    def available(self):
+        return np is not None
+
+    def encrypt_block(self, aes, block):
+        State = np.frombuffer(block.to_bytes(16, 'big'), dtype=np.uint8).reshape(1, 16)
+        return int.from_bytes(aes.CipherBatch(State).tobytes(), 'big')
+
+    def decrypt_block(self, aes, block):
+        State = np.frombuffer(block.to_bytes(16, 'big'), dtype=np.uint8).reshape(1, 16)
+        return int.from_bytes(aes.InvCipherBatch(State).tobytes(), 'big')
+
+    def encrypt_blocks(self, aes, view):
+        States = np.frombuffer(view, dtype=np.uint8).reshape(-1, 16)
+        States[:] = aes.CipherBatch(States)
+
+    def decrypt_blocks(self, aes, view):
+        States = np.frombuffer(view, dtype=np.uint8).reshape(-1, 16)
+        States[:] = aes.InvCipherBatch(States)
+
+
+@register_engine
+class BitslicedEngine(Engine):
+    """
+    All the blocks of a buffer packed in bit planes and transformed with Boolean operations on
+    big integers (CipherBitsliced, InvCipherBitsliced), with no table lookup or branch that
+    depends on the data. The time is not strictly constant though: the operations of Python
+    integers skip their leading zero digits.
+    """
+
+    name = 'bitslice'
+
+    def encrypt_block(self, aes, block):
+        return int.from_bytes(aes.CipherBitsliced(block.to_bytes(16, 'big')), 'big')
+
+    def decrypt_block(self, aes, block):
+        return int.from_bytes(aes.InvCipherBitsliced(block.to_bytes(16, 'big')), 'big')
+
+    def encrypt_blocks(self, aes, view):
+        view[:] = aes.CipherBitsliced(view)
+
+    def decrypt_blocks(self, aes, view):
+        view[:] = aes.InvCipherBitsliced(view)
+
+
+# Known answers used by the self-test of the engines: FIPS 197, Appendix C (key, plaintext, ciphertext)
+FIPS_197_VECTORS = [
+    ('000102030405060708090a0b0c0d0e0f', '00112233445566778899aabbccddeeff', '69c4e0d86a7b0430d8cdb78070b4c55a'),
+    ('000102030405060708090a0b0c0d0e0f1011121314151617', '00112233445566778899aabbccddeeff', 'dda97ca4864cdfe06eaf70a0ec0d7191'),
+    ('000102030405060708090a0b0c0d0e0f101112131415161718191a1b1c1d1e1f', '00112233445566778899aabbccddeeff', '8ea2b7ca516745bfeafc49904b496089'),
+]
+# Encrypted test files named <original file>_0x<polynomial>_<key in hex>.enc, next to the original file
+VALORES_TEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ValoresTest')
+ENGINE_BENCH_BLOCKS = (1, 16, 256) # Payload sizes (in blocks) of the micro-benchmark of the engines
+
+
+def _known_answers():
+    """
+    Returns the known answers as (polynomial, key, IV, plaintext block, ciphertext block):
+    the FIPS 197 vectors (with a zero IV) and the first block of every file in ValoresTest.
+    """
+    vectors = [(0x11B, bytes.fromhex(key), bytes(16), bytes.fromhex(plaintext), bytes.fromhex(ciphertext))
+               for key, plaintext, ciphertext in FIPS_197_VECTORS]
+    try:
+        names = sorted(os.listdir(VALORES_TEST_DIR))
+    except OSError:
+        return vectors
+    for name in names:
+        original, _, rest = name.rpartition('_0x')
+        polinomio, _, key = rest.partition('_')
+        if not (original and name.endswith('.enc') and original in names):
+            continue
+        try:
+            polinomio, key = int(polinomio, 16), bytes.fromhex(key[:-len('.enc')])
+            with open(os.path.join(VALORES_TEST_DIR, name), 'rb') as enc_file, \
+                 open(os.path.join(VALORES_TEST_DIR, original), 'rb') as file:
+                data, plaintext = enc_file.read(32), file.read(16)
+        except (ValueError, OSError):
+            continue
+        if len(key) in (16, 24, 32) and len(data) == 32 and len(plaintext) == 16 and G_F.es_irreducible(polinomio):
+            vectors.append((polinomio, key, data[:16], plaintext, data[16:]))
+    return vectors
+
+
+def _self_test(engine, vectors, key_cache):
+    """
+    Checks the engine against the known answers, one block at a time and in batches.
+    An engine that fails to import what it needs is not correct either; any other error
+    is a bug and is raised.
+    """
+    try:
+        for polinomio, key, IV, plaintext, ciphertext in vectors:
+            algorithm = AES(key, polinomio, engine=engine.name, key_cache=key_cache, disk_cache=False)
+            IV, plaintext, ciphertext = (int.from_bytes(x, 'big') for x in (IV, plaintext, ciphertext))
+            if engine.encrypt_block(algorithm, plaintext ^ IV) != ciphertext:
+                return False
+            if engine.decrypt_block(algorithm, ciphertext) ^ IV != plaintext:
+                return False
+            buffer = bytearray((plaintext ^ IV).to_bytes(16, 'big') * 3)
+            engine.encrypt_blocks(algorithm, memoryview(buffer))
+            if buffer != ciphertext.to_bytes(16, 'big') * 3:
+                return False
+            engine.decrypt_blocks(algorithm, memoryview(buffer))
+            if buffer != (plaintext ^ IV).to_bytes(16, 'big') * 3:
+                return False
+    except ImportError:
+        return False
+    return True
+
+
+def _bench(function, *args, repeats=3):
+    """
+    Returns the best time of a few calls to the function.
+    """
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def select_engines():
+    """
+    Selects (once per process) the engines used by default. Every available engine runs a short
+    self-test against the known answers and the correct ones run a micro-benchmark. Returns
+    {'block': fastest engine for one block at a time, 'batch': [(min blocks, fastest engine for
+    payloads of at least that number of blocks), ...]}.
+    The instances used for the tests have their own key schedule cache and do not use the
+    on-disk table cache, so the selection leaves no trace in either of them.
+    """
+    global _engine_selection
+    with _engine_lock:
+        if _engine_selection is not None:
+            return _engine_selection
+
+        vectors = _known_answers()
+        key_cache = KeyScheduleCache()
+        engines = [engine for engine in ENGINES.values() if engine.available() and _self_test(engine, vectors, key_cache)]
+        if not engines:
+            raise RuntimeError("No engine passed the self-test")
+
+        algorithm = AES(bytes(range(16)), engine=engines[0].name, key_cache=key_cache, disk_cache=False)
+        block = int.from_bytes(os.urandom(16), 'big')
+        block_times = {engine: _bench(lambda engine: [engine.encrypt_block(algorithm, block) for _ in range(8)], engine)
+                       for engine in engines}
+
+        batch = []
+        candidates = engines
+        per_block = {}
+        for blocks in ENGINE_BENCH_BLOCKS:
+            view = memoryview(bytearray(os.urandom(16 * blocks)))
+            times = {engine: _bench(engine.encrypt_blocks, algorithm, view) + _bench(engine.decrypt_blocks, algorithm, view)
+                     for engine in candidates}
+            best = min(times.values())
+            batch.append((blocks, min(times, key=times.get)))
+            # Leave out the engines that are much slower and do not get faster per block with larger payloads
+            candidates = [engine for engine in candidates
+                          if times[engine] < 4 * best or times[engine] / blocks < per_block.get(engine, float('inf')) / 2]
+            per_block = {engine: times[engine] / blocks for engine in candidates}
+
+        _engine_selection = {'block': min(block_times, key=block_times.get), 'batch': batch}
+        return _engine_selection
+
+
+def _process_pool(workers):
+    """
+    Returns a pool of worker processes that run the functions below, or None if the workers
+    would not be able to import this module, in which case the caller does the work itself.
+    The pool uses the default start method, so set_start_method is respected. With fork the
+    workers inherit the module already loaded. With spawn or forkserver they import it again
+    by its name, which only works if it can be found with that name in sys.path (not when it
+    is loaded from aes_Huilin.Ni_Victor.Gesiarz.py as aes).
+    """
+    if multiprocessing.get_start_method() != 'fork' and __name__ != '__main__':
+        spec = importlib.machinery.PathFinder.find_spec(__name__)
+        if spec is None or os.path.abspath(spec.origin) != os.path.abspath(__file__):
+            return None
+    return ProcessPoolExecutor(workers)
+
+
+def _reset_locks_after_fork():
+    """
+    Replaces the locks of the module in a forked child. Another thread of the parent may have
+    been holding one of them (e.g. building the tables of a variant) when the worker was forked,
+    and in the child that thread does not exist, so the lock would never be released.
+    """
+    global _tables_lock, _engine_lock
+    _tables_lock = threading.Lock()
+    _engine_lock = threading.RLock()
+    key_schedule_cache._lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_locks_after_fork)
+
+
+def _ctr_keystream_worker(key, variant, engine, counter, count, counter_bits):
+    """
+    Generates count blocks of CTR keystream in a worker process (see AES._ctr_keystream).
+    """
+    polinomio_irreducible, affine_matrix, affine_const = variant
+    return AES(key, polinomio_irreducible, engine, affine_matrix, affine_const)._ctr_keystream_blocks(counter, count, counter_bits)
+
+
+def _cbc_decrypt_shard_worker(key, variant, engine, file, decrypted_filename, first, count, prev_block, chunk_size):
+    """
+    Decrypts one shard of a file in a worker process (see AES._decrypt_file_mmap).
+    """
+    polinomio_irreducible, affine_matrix, affine_const = variant
+    AES(key, polinomio_irreducible, engine, affine_matrix, affine_const)._cbc_decrypt_shard(file, decrypted_filename, first, count, prev_block, chunk_size)
@@ -0,0 +1,168 @@
+"""
+Catalogue of the 30 finite fields GF(2^8) given by the irreducible polynomials of degree 8.
+For each polynomial it keeps the generator, the EXP and LOG tables, the SBox and InvSBox of
+AES and the rows of the products by the MixColumns and InvMixColumns constants, all of them
+packed in a single bytearray with a fixed record per polynomial.
+The records are built the first time a polynomial is used, so importing the module costs nothing.
+Both AES implementations take their fields and SBoxes from here (see CatalogoCuerpos.cuerpo
+and CatalogoCuerpos.sboxes, or CatalogoCuerpos.filas for the G_F of the main module).
+"""
+
+import os
+import threading
+
+from cuerpo_finito import G_F, AFFINE_MATRIX, AFFINE_CONST
+
+
+# Every irreducible polynomial of degree 8 (G_F.es_irreducible(p) for 0x100 <= p < 0x200)
+POLINOMIOS_IRREDUCIBLES = (
+    0x11B, 0x11D, 0x12B, 0x12D, 0x139, 0x13F, 0x14D, 0x15F, 0x163, 0x165,
+    0x169, 0x171, 0x177, 0x17B, 0x187, 0x18B, 0x18D, 0x19F, 0x1A3, 0x1A9,
+    0x1B1, 0x1BD, 0x1C3, 0x1CF, 0x1D7, 0x1DD, 0x1E7, 0x1F3, 0x1F5, 0x1F9,
+)
+CONSTANTES_MIX_COLUMNS = (0x02, 0x03, 0x09, 0x0b, 0x0d, 0x0e)
+
+# Layout of the record of each polynomial
+EXP = 0 # 512 bytes, duplicated as in G_F so that logarithms can be added without reducing
+LOG = 512 # 256 bytes, LOG[0] is not used
+SBOX = 768
+INV_SBOX = 1024
+FILAS = 1280 # One row of 256 bytes per constant, in the order of CONSTANTES_MIX_COLUMNS
+GENERADOR = FILAS + 256 * len(CONSTANTES_MIX_COLUMNS)
+TAMANO_REGISTRO = 3072
+
+
+class CatalogoCuerpos:
+    """
+    Packed tables of every field of the catalogue. The lookup of a polynomial is a single
+    index in a table of 256 slots, and the tables are memoryviews of its record, without copies.
+    """
+
+    def __init__(self, polinomios=POLINOMIOS_IRREDUCIBLES) -> None:
+        self.polinomios = tuple(polinomios)
+        self._datos = bytearray(TAMANO_REGISTRO * len(self.polinomios))
+        self._vista = memoryview(self._datos).toreadonly() # Records are shared by every user, only _construir writes them
+        self._indices = [-1] * 256 # Index of the record by the low byte of the polynomial
+        for index, polinomio in enumerate(self.polinomios):
+            self._indices[polinomio & 0xFF] = index
+        self._construidos = [False] * len(self.polinomios)
+        self._cuerpos = {}
+        self._lock = threading.Lock()
+
+
+    def __contains__(self, polinomio) -> bool:
+        return polinomio >> 8 == 1 and self._indices[polinomio & 0xFF] >= 0
+
+
+    def __len__(self) -> int:
+        return len(self.polinomios)
+
+
+    def registro(self, polinomio) -> memoryview:
+        """
+        Returns the record of the polynomial, building it the first time it is asked for.
+        """
+        if polinomio not in self:
+            raise ValueError(f"{hex(polinomio)} is not an irreducible polynomial of degree 8")
+        index = self._indices[polinomio & 0xFF]
+        if not self._construidos[index]:
+            with self._lock:
+                if not self._construidos[index]:
+                    self._construir(polinomio, index)
+                    self._construidos[index] = True
+        return self._vista[index * TAMANO_REGISTRO : (index + 1) * TAMANO_REGISTRO]
+
+
+    def construir_todos(self) -> None:
+        """
+        Builds the records of every polynomial of the catalogue at once.
+        """
+        for polinomio in self.polinomios:
+            self.registro(polinomio)
+
+
+    def _construir(self, polinomio, index) -> None:
+        """
+        Fills the record of the polynomial from a new field.
+        """
+        field = G_F(polinomio)
+        start = index * TAMANO_REGISTRO
+        datos = self._datos
+
+        datos[start + EXP : start + EXP + 512] = bytes(field.table_exp)
+        datos[start + LOG : start + LOG + 256] = bytes(field.table_log)
+        SBox, InvSBox = field.sbox()
+        datos[start + SBOX : start + SBOX + 256] = SBox
+        datos[start + INV_SBOX : start + INV_SBOX + 256] = InvSBox
+        for k, constante in enumerate(CONSTANTES_MIX_COLUMNS):
+            offset = start + FILAS + 256 * k
+            datos[offset : offset + 256] = field.fila(constante)
+        datos[start + GENERADOR] = field.generator
+
+
+    def generador(self, polinomio) -> int:
+        return self.registro(polinomio)[GENERADOR]
+
+
+    def exp(self, polinomio) -> memoryview:
+        return self.registro(polinomio)[EXP : EXP + 512]
+
+
+    def log(self, polinomio) -> memoryview:
+        return self.registro(polinomio)[LOG : LOG + 256]
+
+
+    def sbox(self, polinomio) -> memoryview:
+        return self.registro(polinomio)[SBOX : SBOX + 256]
+
+
+    def inv_sbox(self, polinomio) -> memoryview:
+        return self.registro(polinomio)[INV_SBOX : INV_SBOX + 256]
+
+
+    def sboxes(self, polinomio, affine_matrix=AFFINE_MATRIX, affine_const=AFFINE_CONST) -> tuple:
+        """
+        Returns the SBox and InvSBox of the polynomial for the given affine transformation: the
+        ones of the record for the transformation of FIPS 197, or new ones built by the field.
+        """
+        if (tuple(affine_matrix), affine_const) == (AFFINE_MATRIX, AFFINE_CONST):
+            return self.sbox(polinomio), self.inv_sbox(polinomio)
+        return self.cuerpo(polinomio).sbox(affine_matrix, affine_const)
+
+
+    def fila(self, polinomio, constante) -> memoryview:
+        """
+        Returns the row of the products by one of the MixColumns or InvMixColumns constants.
+        """
+        k = CONSTANTES_MIX_COLUMNS.index(constante)
+        return self.registro(polinomio)[FILAS + 256 * k : FILAS + 256 * (k + 1)]
+
+
+    def filas(self, polinomio) -> dict:
+        """
+        Returns the rows of the products by every MixColumns and InvMixColumns constant, by constant,
+        in the format of the filas argument of G_F.from_tables.
+        """
+        registro = self.registro(polinomio)
+        return {constante: registro[FILAS + 256 * k : FILAS + 256 * (k + 1)] for k, constante in enumerate(CONSTANTES_MIX_COLUMNS)}
+
+
+    def cuerpo(self, polinomio) -> G_F:
+        """
+        Returns a G_F of the polynomial created from the tables of the catalogue, including the
+        rows of the MixColumns constants. The same instance is returned every time, so its
+        FiniteNumbers are shared too.
+        """
+        field = self._cuerpos.get(polinomio)
+        if field is None:
+            registro = self.registro(polinomio)
+            field = G_F.from_tables(polinomio, registro[GENERADOR], registro[EXP : EXP + 512], registro[LOG : LOG + 256], self.filas(polinomio))
+            field = self._cuerpos.setdefault(polinomio, field)
+        return field
+
+
+catalogo = CatalogoCuerpos()
+
+if hasattr(os, 'register_at_fork'):
+    # A forked child must not inherit the lock held by a thread of the parent that was building a record
+    os.register_at_fork(after_in_child=lambda: setattr(catalogo, '_lock', threading.Lock()))
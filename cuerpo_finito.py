@@ -1,4 +1,34 @@
-import numpy as np
+try:
+    import numpy as np # Only needed by the array operations
+except ImportError:
+    np = None
+
+
+# Affine transformation of the SBox of AES (FIPS 197, 5.1.1): row j of the matrix gives bit 7 - j of the result
+AFFINE_MATRIX = (0b11111000, 0b01111100, 0b00111110, 0b00011111, 0b10001111, 0b11000111, 0b11100011, 0b11110001)
+AFFINE_CONST = 0x63
+
+
+def check_affine(affine_matrix=None, affine_const=AFFINE_CONST):
+    """
+    Returns the affine transformation of the SBox as (tuple of 8 rows, constant), AFFINE_MATRIX
+    if the matrix is None. Raises ValueError if a row or the constant is not a byte or the matrix
+    is not invertible over GF(2), since then the SBox would not be a permutation.
+    """
+    affine_matrix = AFFINE_MATRIX if affine_matrix is None else tuple(affine_matrix)
+    if len(affine_matrix) != 8 or not all(0 <= n <= 0xFF for n in affine_matrix + (affine_const,)):
+        raise ValueError("The affine matrix must have 8 rows of 8 bits and the constant must be a byte")
+    rows = list(affine_matrix)
+    for rank in range(8): # Gaussian elimination, one pivot per bit
+        bit = 1 << (7 - rank)
+        pivot = next((i for i in range(rank, 8) if rows[i] & bit), None)
+        if pivot is None:
+            raise ValueError("The affine matrix is not invertible, the SBox is not a permutation")
+        rows[rank], rows[pivot] = rows[pivot], rows[rank]
+        for i in range(rank + 1, 8):
+            if rows[i] & bit:
+                rows[i] ^= rows[rank]
+    return affine_matrix, affine_const
 
 
 class G_F:
@@ -7,31 +37,85 @@ class G_F:
     By default, it uses the AES polynomial. The elements of the field are represented by integers 0 <= n <= 255.
     """
     
-    def __init__(self, polinomio_irreducible=0x11B) -> None:
+    def __init__(self, polinomio_irreducible=0x11B, tabla_completa=False) -> None:
         """
         Initializes the field with the given irreducible polynomial.
         Also creates the EXP and LOG tables for efficient multiplication and inversion.
+        With tabla_completa, producto, inverso and division use the full 64 KiB multiplication
+        table instead, built the first time one of them is called.
         """
+        if not self.es_irreducible(polinomio_irreducible):
+            raise ValueError(f"{hex(polinomio_irreducible)} is not an irreducible polynomial of degree 8")
         self.polinomio_irreducible = polinomio_irreducible
         self.table_exp = [0] * 512 
         self.table_log = [0] * 256
         self.generator = self._encontrar_generador()
         self._crear_tablas()
-    
+        self._iniciar_tablas_producto(tabla_completa)
+        self._tablas_array = None # NumPy versions of the tables, created on first use
+        self._tabla_producto_array = None
+
+
+    @classmethod
+    def from_tables(cls, polinomio_irreducible, generator, table_exp, table_log, filas=None):
+        """
+        Creates the field from previously generated EXP and LOG tables,
+        without searching for a generator again. The tables are used as given, without copies.
+        filas can give rows of products by a constant already computed (see fila), by constant.
+        """
+        field = cls.__new__(cls)
+        field.polinomio_irreducible = polinomio_irreducible
+        field.generator = generator
+        field.table_exp = table_exp
+        field.table_log = table_log
+        field._iniciar_tablas_producto(False)
+        field._filas.update(filas or {})
+        field._tablas_array = None
+        field._tabla_producto_array = None
+        return field
+
+
+    @staticmethod
+    def es_irreducible(polinomio) -> bool:
+        """
+        Checks that the polynomial has degree 8 and no factor of degree 1 to 4, which is
+        enough for it to be irreducible (a reducible polynomial of degree 8 has a factor of
+        degree at most 4). Each factor is tested by computing the remainder of the division.
+        """
+        if polinomio >> 8 != 1:
+            return False
+        for divisor in range(2, 32):
+            degree = divisor.bit_length()
+            remainder = polinomio
+            while remainder.bit_length() >= degree:
+                remainder ^= divisor << (remainder.bit_length() - degree)
+            if remainder == 0:
+                return False
+        return True
+
+
+    def potencia(self, a, n) -> int:
+        """
+        Returns a^n using square and multiply, so it needs about 2 * log2(n) products.
+        It only uses producto_lento, so it can be called before the tables exist.
+        """
+        result = 1
+        while n > 0:
+            if n & 1:
+                result = self.producto_lento(result, a)
+            a = self.producto_lento(a, a)
+            n >>= 1
+        return result
+
 
     def _encontrar_generador(self) -> int:
         """
-        Tries different numbers to find a valid generator that covers all elements in the field.
+        Returns the smallest generator of the multiplicative group, which has order 255 = 3 * 5 * 17.
+        The order of a candidate g divides 255, so g is a generator unless g^(255/p) == 1 for one
+        of the prime factors p.
         """
         for candidate in range(2, 256):
-            seen_elements = set()
-            element = 1
-            
-            for _ in range(255):
-                seen_elements.add(element)
-                element = self.producto_lento(element, candidate)
-            
-            if len(seen_elements) == 255:
+            if all(self.potencia(candidate, 255 // p) != 1 for p in (3, 5, 17)):
                 return candidate
         raise ValueError("No valid generator found")
 
@@ -39,15 +123,21 @@ class G_F:
     def _crear_tablas(self) -> None:
         """
         Creates the EXP and LOG tables using the found generator.
+        The product by the generator is linear, so each power is the previous one multiplied
+        with two lookups in the products of the generator by the low and the high nibbles.
         """
+        generator = self.generator
+        low = [self.producto_lento(generator, n) for n in range(16)]
+        high = [self.producto_lento(generator, n << 4) for n in range(16)]
+        table_exp, table_log = self.table_exp, self.table_log
         x = 1 
         for i in range(255):
-            self.table_exp[i] = x 
-            self.table_log[x] = i 
-            x = self.producto_lento(x, self.generator)
+            table_exp[i] = x 
+            table_log[x] = i 
+            x = low[x & 15] ^ high[x >> 4]
     
         for i in range(255, 512):
-            self.table_exp[i] = self.table_exp[i - 255]
+            table_exp[i] = table_exp[i - 255]
 		
 
     def suma(self, a, b) -> int:
@@ -107,20 +197,249 @@ class G_F:
         """
         if a == 0 or b == 0:
             return 0
-        log_sum = self.table_log[a] - self.table_log[b]
-        return self.table_exp[log_sum]
+        log_diff = self.table_log[a] - self.table_log[b] + 255 # Always in 1..509, no negative indexes
+        return self.table_exp[log_diff]
+
+
+    def _iniciar_tablas_producto(self, tabla_completa) -> None:
+        """
+        Prepares the full multiplication table, the inverse table and the rows of products by a
+        constant, all of them created the first time they are needed. With tabla_completa the
+        instance uses the full table for producto, inverso and division.
+        """
+        self._tabla_producto = None
+        self._tabla_inverso = None
+        self._filas = {}
+        self.tabla_completa = tabla_completa
+        if tabla_completa:
+            self.producto = self._producto_tabla
+            self.inverso = self._inverso_tabla
+            self.division = self._division_tabla
+
+
+    def fila(self, n) -> bytes:
+        """
+        Returns the row of products by the constant n as 256 bytes: fila(n)[x] is the product of
+        n and x. MixColumns and InvMixColumns index the rows of 02, 03, 09, 0b, 0d and 0e directly.
+        """
+        row = self._filas.get(n)
+        if row is None:
+            if self._tabla_producto is not None:
+                row = self._tabla_producto[n << 8 : (n + 1) << 8]
+            elif n == 0:
+                row = bytes(256)
+            else:
+                table_exp, table_log = self.table_exp, self.table_log
+                log_n = table_log[n]
+                row = bytes([0] + [table_exp[log_n + table_log[x]] for x in range(1, 256)])
+            self._filas[n] = row
+        return row
+
+
+    @property
+    def tabla_producto(self) -> bytes:
+        """
+        Full multiplication table as a flat 64 KiB bytes object: the product of a and b is
+        tabla_producto[(a << 8) | b]. It is built the first time it is used.
+        """
+        if self._tabla_producto is None:
+            self._tabla_producto = b''.join(self.fila(n) for n in range(256))
+        return self._tabla_producto
+
+
+    @property
+    def tabla_inverso(self) -> bytes:
+        """
+        Table of the 256 multiplicative inverses, with 0 as the inverse of 0.
+        """
+        if self._tabla_inverso is None:
+            table_exp, table_log = self.table_exp, self.table_log
+            self._tabla_inverso = bytes([0] + [table_exp[255 - table_log[n]] for n in range(1, 256)])
+        return self._tabla_inverso
+
+
+    def sbox(self, affine_matrix=AFFINE_MATRIX, affine_const=AFFINE_CONST) -> tuple:
+        """
+        Returns the SBox and InvSBox of AES over this field as two bytes objects: the inverse of
+        each byte followed by the affine transformation (FIPS 197, 5.1.1).
+        The transformation is linear over GF(2), so the image of a byte is the XOR of the images
+        of its bits: they are combined once in two tables of 16 entries (low and high nibble)
+        and each entry of the SBox is two lookups applied to the table of inverses.
+        The transformation is checked with check_affine.
+        """
+        affine_matrix, affine_const = check_affine(affine_matrix, affine_const)
+        # Image of bit k: bit 7 - j of the image is bit k of row j
+        columns = [sum(((row >> k) & 1) << (7 - j) for j, row in enumerate(affine_matrix)) for k in range(8)]
+        low, high = [0] * 16, [0] * 16
+        for n in range(16):
+            for k in range(4):
+                if (n >> k) & 1:
+                    low[n] ^= columns[k]
+                    high[n] ^= columns[k + 4]
+
+        SBox = bytes([low[inverse & 15] ^ high[inverse >> 4] ^ affine_const for inverse in self.tabla_inverso])
+        InvSBox = bytearray(256)
+        for i, result in enumerate(SBox):
+            InvSBox[result] = i
+        return SBox, bytes(InvSBox)
+
+
+    def _producto_tabla(self, a, b) -> int:
+        """
+        Returns the product of two elements with a single lookup in the full table.
+        """
+        return self.tabla_producto[(a << 8) | b]
+
+
+    def _inverso_tabla(self, n) -> int:
+        """
+        Returns the multiplicative inverse of n with a lookup in the inverse table.
+        """
+        return self.tabla_inverso[n]
+
+
+    def _division_tabla(self, a, b) -> int:
+        """
+        Returns the division between a and b as the product of a and the inverse of b.
+        """
+        return self.tabla_producto[(a << 8) | self.tabla_inverso[b]]
+
+
+    def _get_tablas_array(self):
+        """
+        Returns the EXP and LOG tables as NumPy arrays, created the first time they are needed.
+        """
+        if self._tablas_array is None:
+            self._tablas_array = (np.array(self.table_exp, dtype=np.uint8), np.array(self.table_log, dtype=np.int32))
+        return self._tablas_array
+
+
+    def tabla_producto_array(self):
+        """
+        Returns the full 256x256 multiplication table as a read-only uint8 array: tabla[a, b]
+        is the product of a and b. It is a view of tabla_producto, so the 64 KiB are only built once.
+        """
+        if self._tabla_producto_array is None:
+            self._tabla_producto_array = np.frombuffer(self.tabla_producto, dtype=np.uint8).reshape(256, 256)
+        return self._tabla_producto_array
+
+
+    def suma_array(self, a, b):
+        """
+        Returns the element-wise sum (XOR) of two uint8 arrays (or an array and a scalar).
+        """
+        return np.bitwise_xor(np.asarray(a, dtype=np.uint8), np.asarray(b, dtype=np.uint8))
+
+
+    def producto_array(self, a, b):
+        """
+        Returns the element-wise product of two uint8 arrays of any shape (broadcast together),
+        or of a scalar and an array, with lookups in the full multiplication table.
+        """
+        tabla = self.tabla_producto_array()
+        if np.ndim(a) == 0: # Scalar by array, a single row of the table
+            return tabla[int(a)][np.asarray(b, dtype=np.uint8)]
+        if np.ndim(b) == 0:
+            return tabla[int(b)][np.asarray(a, dtype=np.uint8)]
+        return tabla[np.asarray(a, dtype=np.uint8), np.asarray(b, dtype=np.uint8)]
+
+
+    def inverso_array(self, a):
+        """
+        Returns the element-wise multiplicative inverse of a uint8 array. The inverse of 0 is 0.
+        """
+        exp, log = self._get_tablas_array()
+        a = np.asarray(a, dtype=np.uint8)
+        return np.where(a == 0, 0, exp[255 - log[a]]).astype(np.uint8)
+
+
+    def division_array(self, a, b):
+        """
+        Returns the element-wise division of two uint8 arrays (or an array and a scalar).
+        As in division, the result is 0 if a or b is 0.
+        """
+        exp, log = self._get_tablas_array()
+        a = np.asarray(a, dtype=np.uint8)
+        b = np.asarray(b, dtype=np.uint8)
+        result = exp[log[a] - log[b] + 255]
+        return np.where((a == 0) | (b == 0), 0, result).astype(np.uint8)
+
+
+    def potencia_array(self, a, n):
+        """
+        Returns the element-wise power a^n of a uint8 array, n being an integer or an array of
+        integers (negative exponents are powers of the inverse). 0^0 is 1 and 0^n is 0 otherwise.
+        """
+        exp, log = self._get_tablas_array()
+        a = np.asarray(a, dtype=np.uint8)
+        n = np.asarray(n, dtype=np.int64)
+        result = exp[np.mod(log[a] * n, 255)]
+        return np.where(a == 0, np.where(n == 0, 1, 0), result).astype(np.uint8)
 
 
 
 class FiniteNumber:
+    """
+    Element of a finite field. The instances are immutable and interned: each field keeps the
+    256 canonical instances of its elements, so creating a number or operating with numbers
+    returns one of them instead of allocating a new object.
+    """
+    __slots__ = ('FiniteField', 'number', 'format')
     _display_format = "decimal" 
 
-    def __init__(self, number, FiniteField, format='Decimal') -> None:
-        self.FiniteField = FiniteField  
-        self.number = number 
-        self.format = format
-        self.left = (self.number >> 4) & 0xF
-        self.right = self.number & 0xF
+    def __new__(cls, number, FiniteField, format='Decimal'):
+        if not 0 <= number < 256: # Not an element of the field, it is not interned
+            return cls._create(number, FiniteField, format)
+
+        # The canonical instances are kept in the field itself, by format and number
+        try:
+            instances = FiniteField._finite_numbers[format]
+        except AttributeError:
+            FiniteField._finite_numbers = {}
+            instances = FiniteField._finite_numbers[format] = [None] * 256
+        except KeyError:
+            instances = FiniteField._finite_numbers[format] = [None] * 256
+
+        instance = instances[number]
+        if instance is None:
+            instance = instances[number] = cls._create(int(number), FiniteField, format)
+        return instance
+
+    @classmethod
+    def _create(cls, number, FiniteField, format):
+        """ Allocates a new instance, the only place where its attributes are set """
+        instance = object.__new__(cls)
+        object.__setattr__(instance, 'FiniteField', FiniteField)
+        object.__setattr__(instance, 'number', number)
+        object.__setattr__(instance, 'format', format)
+        return instance
+
+    def __setattr__(self, name, value):
+        # The instances are shared, changing one would change it for every holder
+        raise AttributeError(f"FiniteNumber is immutable, '{name}' can not be set")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"FiniteNumber is immutable, '{name}' can not be deleted")
+
+    def __reduce__(self):
+        # Unpickled through __new__, so the result is the interned instance of the field
+        return (FiniteNumber, (self.number, self.FiniteField, self.format))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    @property
+    def left(self):
+        """ Returns the 4 high bits of the number """
+        return (self.number >> 4) & 0xF
+
+    @property
+    def right(self):
+        """ Returns the 4 low bits of the number """
+        return self.number & 0xF
 
     @classmethod
     def set_format(cls, display_format):
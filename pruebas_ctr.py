@@ -0,0 +1,56 @@
+from aes import AES, CHUNK_SIZE
+
+# Known answer tests of CTR mode from NIST SP 800-38A, F.5.1 (AES-128) and F.5.5 (AES-256)
+Counter = bytes.fromhex('f0f1f2f3f4f5f6f7f8f9fafbfcfdfeff')
+
+Plaintext = bytes.fromhex(
+    '6bc1bee22e409f96e93d7e117393172a'
+    'ae2d8a571e03ac9c9eb76fac45af8e51'
+    '30c81c46a35ce411e5fbc1191a0a52ef'
+    'f69f2445df4f9b17ad2b417be66c3710'
+)
+
+Vectors = [
+    ("F.5.1 CTR-AES128", '2b7e151628aed2a6abf7158809cf4f3c',
+     '874d6191b620e3261bef6864990db6ce'
+     '9806f66b7970fdff8617187bb9fffdff'
+     '5ae4df3edbd5d35e5b4f09020db03eab'
+     '1e031dda2fbe03d1792170a0f3009cee'),
+    ("F.5.5 CTR-AES256", '603deb1015ca71be2b73aef0857d77811f352c073b6108d72d9810a30914dff4',
+     '601ec313775789a5b7a7f504bbf3d228'
+     'f443e3ca4d62b59aca84e990cacaf5c5'
+     '2b0930daa23de94ce87017ba2d84988d'
+     'dfc9c58db67aada613c2dd08457941a6'),
+]
+
+
+def test_ctr(name, key, ciphertext):
+    algorithm = AES(key=bytes.fromhex(key))
+    ciphertext = bytes.fromhex(ciphertext)
+    print(name)
+
+    encrypted = bytes(algorithm.encrypt_ctr(Plaintext, Counter))
+    print("CIPHERTEXT", encrypted.hex(), encrypted == ciphertext)
+
+    decrypted = bytes(algorithm.decrypt_ctr(ciphertext, Counter))
+    print("PLAINTEXT ", decrypted.hex(), decrypted == Plaintext)
+
+    # Random access: the last 40 bytes on their own, starting in the middle of a block
+    partial = bytes(algorithm.decrypt_ctr(ciphertext[24:], Counter, offset=24))
+    print("OFFSET 24 ", partial == Plaintext[24:])
+
+    # Only payloads longer than CHUNK_SIZE are split between processes: the plaintext repeated
+    # over two chunks and a half, with a key buffer that the caller overwrites after creating the cipher
+    buffer = bytearray.fromhex(key)
+    algorithm = AES(key=buffer)
+    buffer[:] = bytes(len(buffer))
+    data = Plaintext * (5 * CHUNK_SIZE // 2 // len(Plaintext)) + Plaintext[:24]
+    serial = bytes(algorithm.encrypt_ctr(data, Counter))
+    parallel = bytes(algorithm.encrypt_ctr(data, Counter, processes=2))
+    print("PROCESSES ", parallel == serial, parallel[:len(ciphertext)] == ciphertext)
+    print()
+
+
+if __name__ == '__main__':
+    for vector in Vectors:
+        test_ctr(*vector)
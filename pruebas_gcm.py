@@ -0,0 +1,68 @@
+from aes import AES
+
+# Known answer tests of GCM from "The Galois/Counter Mode of Operation (GCM)", McGrew and Viega,
+# Appendix B: test cases 1 to 6 (AES-128) and 16 (AES-256)
+P = ('d9313225f88406e5a55909c5aff5269a86a7a9531534f7da2e4c303d8a318a72'
+     '1c3c0c95956809532fcf0e2449a6b525b16aedf5aa0de657ba637b39')
+A = 'feedfacedeadbeeffeedfacedeadbeefabaddad2'
+K = 'feffe9928665731c6d6a8f9467308308'
+
+# (name, key, plaintext, AAD, IV, ciphertext, tag)
+Vectors = [
+    ("Test case 1", '00000000000000000000000000000000', '', '', '000000000000000000000000',
+     '', '58e2fccefa7e3061367f1d57a4e7455a'),
+    ("Test case 2", '00000000000000000000000000000000', '00000000000000000000000000000000', '', '000000000000000000000000',
+     '0388dace60b6a392f328c2b971b2fe78', 'ab6e47d42cec13bdf53a67b21257bddf'),
+    ("Test case 3", K, P + '1aafd255', '', 'cafebabefacedbaddecaf888',
+     '42831ec2217774244b7221b784d0d49ce3aa212f2c02a4e035c17e2329aca12e'
+     '21d514b25466931c7d8f6a5aac84aa051ba30b396a0aac973d58e091473f5985', '4d5c2af327cd64a62cf35abd2ba6fab4'),
+    ("Test case 4", K, P, A, 'cafebabefacedbaddecaf888',
+     '42831ec2217774244b7221b784d0d49ce3aa212f2c02a4e035c17e2329aca12e'
+     '21d514b25466931c7d8f6a5aac84aa051ba30b396a0aac973d58e091', '5bc94fbc3221a5db94fae95ae7121a47'),
+    ("Test case 5 (IV of 8 bytes)", K, P, A, 'cafebabefacedbad',
+     '61353b4c2806934a777ff51fa22a4755699b2a714fcdc6f83766e5f97b6c7423'
+     '73806900e49f24b22b097544d4896b424989b5e1ebac0f07c23f4598', '3612d2e79e3b0785561be14aaca2fccb'),
+    ("Test case 6 (IV of 60 bytes)", K, P, A,
+     '9313225df88406e555909c5aff5269aa6a7a9538534f7da1e4c303d2a318a728'
+     'c3c0c95156809539fcf0e2429a6b525416aedbf5a0de6a57a637b39b',
+     '8ce24998625615b603a033aca13fb894be9112a5c3a211a8ba262a3cca7e2ca7'
+     '01e4a9a4fba43c90ccdcb281d48c7c6fd62875d2aca417034c34aee5', '619cc5aefffe0bfa462af43c1699d050'),
+    ("Test case 16 (AES-256)", K + K, P, A, 'cafebabefacedbaddecaf888',
+     '522dc1f099567d07f47f37a32a84427d643a8cdcbfe5c0c97598a2bd2555d1aa'
+     '8cb08e48590dbb3da7b08b1056828838c5f61e6393ba7a0abcc9f662', '76fc6ece0f4e1768cddf8853bb2d551b'),
+]
+
+
+def rejected(algorithm, ciphertext, IV, tag, aad):
+    """ Returns whether decrypt_gcm refuses the data with that tag """
+    try:
+        algorithm.decrypt_gcm(ciphertext, IV, tag, aad)
+    except ValueError:
+        return True
+    return False
+
+
+def test_gcm(name, key, plaintext, aad, IV, ciphertext, tag):
+    algorithm = AES(key=bytes.fromhex(key))
+    plaintext, aad, IV = bytes.fromhex(plaintext), bytes.fromhex(aad), bytes.fromhex(IV)
+    ciphertext, tag = bytes.fromhex(ciphertext), bytes.fromhex(tag)
+    print(name)
+
+    encrypted, computed_tag = algorithm.encrypt_gcm(plaintext, IV, aad)
+    print("CIPHERTEXT", bytes(encrypted).hex(), bytes(encrypted) == ciphertext)
+    print("TAG       ", computed_tag.hex(), computed_tag == tag)
+
+    decrypted = algorithm.decrypt_gcm(ciphertext, IV, tag, aad)
+    print("PLAINTEXT ", bytes(decrypted) == plaintext)
+
+    # Any change of the ciphertext, the AAD or the tag must be detected
+    modified = bytes([ciphertext[0] ^ 1]) + ciphertext[1:] if ciphertext else ciphertext
+    print("REJECTED  ", rejected(algorithm, ciphertext, IV, bytes([tag[0] ^ 1]) + tag[1:], aad),
+          rejected(algorithm, ciphertext, IV, tag, aad + b'\0'),
+          not ciphertext or rejected(algorithm, modified, IV, tag, aad))
+    print()
+
+
+if __name__ == '__main__':
+    for vector in Vectors:
+        test_gcm(*vector)